@@ -0,0 +1,338 @@
+"""
+Бенчмарк основных сценариев бота без Telegram.
+
+Синтетические апдейты прогоняются через настоящий Dispatcher (bot.create_dispatcher)
+и локальную базу из .env; Bot API заменён заглушкой FakeSession. Для каждого сценария
+печатаются p50/p95/p99 задержки апдейта, SQL-запросы на апдейт и пик аллокаций,
+и всё сравнивается с сохранённым baseline.json.
+
+    python -m benchmarks.run                    # прогнать и сравнить с baseline
+    python -m benchmarks.run --save-baseline    # записать новый baseline
+    python -m benchmarks.run -n 200 --flow start_tutor --fail-on-regression
+
+Внимание: сценарии пишут в базу (тестовые пользователи с telegram_id от 9_100_000_000,
+удаляются в конце). Запускать только на локальной/тестовой базе.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod, GetFile, SendPhoto
+from aiogram.types import Update, Message, CallbackQuery, User, Chat, PhotoSize, File
+from sqlalchemy import event, delete, select, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from bot import create_dispatcher
+from conf import engine, get_db, setup_logger
+from database.db_scripts import init_db, get_next_pending_payment
+from database.models import Admin, Tutor, Student, Parent, PendingPayment, FSMRecord, LessonEvent, \
+    student_tutor_association
+from handlers.services import blob_path, BLOBS_DIR
+from handlers.tutor_panel import StudentCallback
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+ID_BASE = 9_100_000_000
+ADMIN_ID, TUTOR_ID, STUDENT_ID, PARENT_ID, UNKNOWN_ID = (ID_BASE + i for i in range(1, 6))
+# Рост p95 больше чем на столько считается регрессией; рост числа запросов — всегда
+LATENCY_TOLERANCE = 0.20
+BENCH_PHOTO = "bench-screenshot"  # file_unique_id скриншота оплаты
+
+
+class FakeSession(BaseSession):
+    """Заглушка сессии Bot API: ничего не отправляет, возвращает правдоподобные объекты."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Dict[str, int] = {}
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: Optional[int] = None) -> Any:
+        name = method.__api_method__
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+        if isinstance(method, GetFile):
+            return File(file_id=method.file_id, file_unique_id=f"u-{method.file_id}", file_path="photos/bench.jpg")
+
+        returning = str(method.__returning__)
+        if "Message" not in returning:
+            return True
+
+        self._message_id += 1
+        chat_id = getattr(method, "chat_id", None) or 0
+        photo = None
+        if isinstance(method, SendPhoto):
+            photo = [PhotoSize(file_id=f"bench-photo-{self._message_id}", file_unique_id="bench-photo",
+                               width=1, height=1)]
+        return Message(
+            message_id=self._message_id,
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            text=getattr(method, "text", None),
+            photo=photo
+        )
+
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b"\xff\xd8\xff" + b"\x00" * 1024
+
+    async def close(self) -> None:
+        pass
+
+
+_update_id = 0
+
+
+def _next_update_id() -> int:
+    global _update_id
+    _update_id += 1
+    return _update_id
+
+
+def _user(user_id: int) -> User:
+    return User(id=user_id, is_bot=False, first_name=f"bench{user_id}")
+
+
+def message_update(user_id: int, text: str | None = None, photo: str | None = None) -> Update:
+    message = Message(
+        message_id=_next_update_id(),
+        date=datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=_user(user_id),
+        text=text,
+        photo=[PhotoSize(file_id=photo, file_unique_id=photo, width=1, height=1)] if photo else None
+    )
+    return Update(update_id=_update_id, message=message)
+
+
+def callback_update(user_id: int, data: str) -> Update:
+    message = Message(message_id=_next_update_id(), date=datetime.now(), chat=Chat(id=user_id, type="private"))
+    callback = CallbackQuery(id=str(_update_id), from_user=_user(user_id), chat_instance="bench",
+                             message=message, data=data)
+    return Update(update_id=_update_id, callback_query=callback)
+
+
+async def seed():
+    async with get_db() as db:
+        await db.execute(insert(Admin).values(telegram_id=ADMIN_ID, name="Bench Admin", is_admin=True)
+                         .on_conflict_do_nothing())
+        await db.execute(insert(Tutor).values(telegram_id=TUTOR_ID, name="Bench Tutor", is_admin=False)
+                         .on_conflict_do_nothing())
+        await db.execute(insert(Parent).values(telegram_id=PARENT_ID, name="Bench Parent")
+                         .on_conflict_do_nothing())
+        parent_id = (await db.execute(select(Parent.id).where(Parent.telegram_id == PARENT_ID))).scalar()
+        await db.execute(insert(Student).values(telegram_id=STUDENT_ID, name="Bench Student", is_admin=False,
+                                                payed_lessons=0, parent_id=parent_id).on_conflict_do_nothing())
+        student_id = (await db.execute(select(Student.id).where(Student.telegram_id == STUDENT_ID))).scalar()
+        tutor_id = (await db.execute(select(Tutor.id).where(Tutor.telegram_id == TUTOR_ID))).scalar()
+        await db.execute(insert(student_tutor_association).values(student_id=student_id, tutor_id=tutor_id)
+                         .on_conflict_do_nothing())
+        await db.commit()
+    return student_id
+
+
+async def cleanup():
+    bench_ids = (ADMIN_ID, TUTOR_ID, STUDENT_ID, PARENT_ID, UNKNOWN_ID)
+    async with get_db() as db:
+        bench_students = select(Student.id).where(Student.telegram_id == STUDENT_ID)
+        bench_payments = select(PendingPayment.id).where(PendingPayment.parent_id == PARENT_ID)
+        # журнал не удаляется вместе с учеником (SET NULL), поэтому чистим его первым, пока связи целы
+        await db.execute(delete(LessonEvent).where(or_(
+            LessonEvent.student_id.in_(bench_students),
+            LessonEvent.payment_id.in_(bench_payments),
+            LessonEvent.tutor_id.in_(bench_ids),
+            LessonEvent.admin_id.in_(bench_ids),
+        )))
+        await db.execute(delete(PendingPayment).where(PendingPayment.parent_id == PARENT_ID))
+        await db.execute(delete(student_tutor_association).where(
+            student_tutor_association.c.student_id.in_(bench_students)
+        ))
+        for model in (Student, Parent, Tutor, Admin):
+            await db.execute(delete(model).where(model.telegram_id.in_(bench_ids)))
+        await db.execute(delete(FSMRecord).where(or_(*(FSMRecord.key.contains(f":{i}:") for i in bench_ids))))
+        await db.commit()
+
+    photo = blob_path(BENCH_PHOTO)
+    photo.unlink(missing_ok=True)
+    for directory in (photo.parent, photo.parent.parent):
+        if directory != BLOBS_DIR and directory.exists() and not any(directory.iterdir()):
+            directory.rmdir()
+
+
+def build_flows(student_id: int) -> Dict[str, Callable[[], Any]]:
+    """Сценарий — корутина-фабрика, отдающая апдейты по одному (следующий может зависеть от базы)."""
+
+    def start(user_id):
+        async def flow():
+            yield message_update(user_id, "/start")
+        return flow
+
+    async def tutor_attendance():
+        toggle = StudentCallback(telegram_id=STUDENT_ID).pack()
+        yield message_update(TUTOR_ID, "➕ Отметить занятия")
+        yield callback_update(TUTOR_ID, toggle)
+        yield callback_update(TUTOR_ID, toggle)
+        yield callback_update(TUTOR_ID, toggle)
+        yield callback_update(TUTOR_ID, "done")
+
+    async def parent_payment():
+        yield message_update(PARENT_ID, "➕ Оплата")
+        yield callback_update(PARENT_ID, f"pay_student_{student_id}_Bench Student")
+        yield message_update(PARENT_ID, "1")
+        yield message_update(PARENT_ID, photo=BENCH_PHOTO)
+
+    async def admin_review():
+        yield message_update(ADMIN_ID, "➕ Проверить оплаты")
+        payment = await get_next_pending_payment()
+        if payment is not None:
+            yield callback_update(ADMIN_ID, f"approve_{payment.id}")
+        yield callback_update(ADMIN_ID, "stop_review")
+
+    async def show_db():
+        yield message_update(ADMIN_ID, "/show_db_Student")
+
+    return {
+        "start_admin": start(ADMIN_ID),
+        "start_tutor": start(TUTOR_ID),
+        "start_student": start(STUDENT_ID),
+        "start_parent": start(PARENT_ID),
+        "start_unknown": start(UNKNOWN_ID),
+        "tutor_attendance": tutor_attendance,
+        "parent_payment": parent_payment,
+        "admin_review": admin_review,
+        "show_db": show_db,
+    }
+
+
+def _percentile(values: list[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def run_flow(dp, bot, flow, iterations: int, track_allocations: bool) -> dict:
+    latencies, queries, peaks = [], [], []
+    query_count = 0
+
+    def count_query(*args):
+        nonlocal query_count
+        query_count += 1
+
+    event.listen(engine.sync_engine, "after_cursor_execute", count_query)
+    try:
+        for _ in range(iterations):
+            async for update in flow():
+                query_count = 0
+                if track_allocations:
+                    tracemalloc.reset_peak()
+                    base = tracemalloc.get_traced_memory()[0]
+                start = time.perf_counter()
+                await dp.feed_update(bot, update)
+                latencies.append(time.perf_counter() - start)
+                queries.append(query_count)
+                if track_allocations:
+                    peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        event.remove(engine.sync_engine, "after_cursor_execute", count_query)
+
+    return {"latencies": latencies, "queries": queries, "peaks": peaks}
+
+
+def summarize(timed: dict, allocated: dict) -> dict:
+    latencies_ms = [value * 1000 for value in timed["latencies"]]
+    return {
+        "updates": len(latencies_ms),
+        "p50_ms": round(_percentile(latencies_ms, 50), 3),
+        "p95_ms": round(_percentile(latencies_ms, 95), 3),
+        "p99_ms": round(_percentile(latencies_ms, 99), 3),
+        "queries_per_update": round(statistics.fmean(timed["queries"]), 2),
+        "alloc_peak_kib_p50": round(statistics.median(allocated["peaks"]) / 1024, 1) if allocated["peaks"] else 0,
+    }
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + LATENCY_TOLERANCE):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} → {current['p95_ms']} мс")
+        if current["queries_per_update"] > previous["queries_per_update"]:
+            regressions.append(
+                f"{name}: запросов на апдейт {previous['queries_per_update']} → {current['queries_per_update']}"
+            )
+    return regressions
+
+
+def print_table(results: dict, baseline: dict):
+    header = f"{'flow':<18}{'updates':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'q/upd':>8}{'KiB':>8}{'Δp95':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        previous = baseline.get(name)
+        delta = f"{(r['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%" if previous and previous["p95_ms"] else "—"
+        print(f"{name:<18}{r['updates']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['queries_per_update']:>8}{r['alloc_peak_kib_p50']:>8}{delta:>9}")
+
+
+async def main(args) -> int:
+    setup_logger()
+    await init_db()
+    student_id = await seed()
+    bot = Bot(token="42:BENCHMARK", session=FakeSession())
+    dp = create_dispatcher()
+
+    flows = build_flows(student_id)
+    if args.flow:
+        flows = {name: flows[name] for name in args.flow}
+
+    results = {}
+    try:
+        for name, flow in flows.items():
+            await run_flow(dp, bot, flow, args.warmup, track_allocations=False)
+            timed = await run_flow(dp, bot, flow, args.iterations, track_allocations=False)
+            tracemalloc.start()
+            try:
+                allocated = await run_flow(dp, bot, flow, max(args.iterations // 10, 1), track_allocations=True)
+            finally:
+                tracemalloc.stop()
+            results[name] = summarize(timed, allocated)
+    finally:
+        await cleanup()
+        await bot.session.close()
+        await engine.dispose()
+
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        BASELINE_PATH.write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n")
+        print(f"\nBaseline сохранён в {BASELINE_PATH}")
+        return 0
+
+    regressions = compare(results, baseline)
+    if regressions:
+        print("\n⚠️ Регрессии относительно baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1 if args.fail_on_regression else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк сценариев бота")
+    parser.add_argument("-n", "--iterations", type=int, default=100, help="прогонов каждого сценария")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--flow", action="append", help="только этот сценарий (можно несколько раз)")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,31 +1,77 @@
 import asyncio
 from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.base import BaseStorage
 
-from conf import TOKEN, setup_logger
+from conf import TOKEN, BOT_MODE, MIGRATE_ON_STARTUP, METRICS_HOST, METRICS_PORT, LOW_BALANCE_CHECK_INTERVAL, \
+    engine, setup_logger
 from handlers.auth import auth
 from handlers.admin_panel import admin_router
 from handlers.parent_panel import parent_router
 from handlers.student_panel import student_router
 from handlers.tutor_panel import tutor_router
 from handlers.admin_commands import dev_router
+from handlers.middlewares import RoleMiddleware, SQLStatsMiddleware, HandlerContextMiddleware, \
+    UpdateMetricsMiddleware, HandlerMetricsMiddleware
+from handlers.routing import RoleRouter
+from handlers.notifications import low_balance_reminder_loop
 from database.db_scripts import init_db
+from database.fsm_storage import PostgresStorage, UpdateScopeIsolation
+from database.instrumentation import install_sql_instrumentation
+from metrics import ApiMetricsMiddleware, start_metrics_server
+from outbound import outbound_scheduler
+from webhook import run_webhook
+
+
+def create_dispatcher(storage: BaseStorage | None = None) -> Dispatcher:
+    """Диспетчер со всеми мидлварями и роутерами. storage — для тестов; по умолчанию PostgresStorage."""
+    if storage is None:
+        storage = PostgresStorage()
+        dp = Dispatcher(storage=storage, events_isolation=UpdateScopeIsolation(storage))
+    else:
+        dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    dp.update.outer_middleware(SQLStatsMiddleware())
+    dp.update.outer_middleware(RoleMiddleware())
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(HandlerMetricsMiddleware())
+        observer.middleware(HandlerContextMiddleware())
+
+    dp.include_router(auth)
+    dp.include_router(RoleRouter(
+        name="roles",
+        admin=admin_router,
+        roles={
+            'tutor': tutor_router,
+            'student': student_router,
+            'parent': parent_router,
+        },
+        common=[dev_router]
+    ))
+    return dp
 
 
 async def main():
     setup_logger()
-    # await init_db()
+    install_sql_instrumentation(engine)
+    if MIGRATE_ON_STARTUP:
+        await init_db()
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_HOST, METRICS_PORT)
     bot = Bot(token=TOKEN)
-    dp = Dispatcher()
+    # очередь снаружи: метрики API видят каждую попытку отдельно, без времени ожидания в очереди
+    bot.session.middleware(outbound_scheduler)
+    bot.session.middleware(ApiMetricsMiddleware())
+    dp = create_dispatcher()
+    if LOW_BALANCE_CHECK_INTERVAL:
+        # ссылка держит задачу живой до конца main; при выходе asyncio.run её отменит
+        reminders = asyncio.create_task(low_balance_reminder_loop(bot))
 
-    dp.include_router(auth)
-    dp.include_router(admin_router)
-    dp.include_router(tutor_router)
-    dp.include_router(student_router)
-    dp.include_router(parent_router)
-    dp.include_router(dev_router)
-    await bot.delete_webhook(drop_pending_updates=True)
     print('Бот готов к использованию!✅')
-    await dp.start_polling(bot)
+    if BOT_MODE == 'webhook':
+        await run_webhook(dp, bot)
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await dp.start_polling(bot)
 
 
 
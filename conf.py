@@ -6,21 +6,84 @@ from contextlib import asynccontextmanager
 from loguru import logger
 import sys
 
+from database.pool import InstrumentedPool
+
 
 load_dotenv()
 
 TOKEN = os.getenv("TOKEN")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
 
+# Режим работы: 'polling' (по умолчанию) или 'webhook'
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")  # публичный https-адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # обязателен в режиме webhook
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "40"))
+# Сколько апдейтов может ждать свободного слота; сверх этого webhook отвечает 503
+WEBHOOK_MAX_BACKLOG = int(os.getenv("WEBHOOK_MAX_BACKLOG", "1000"))
+
+# Эндпоинт метрик Prometheus (GET /metrics). METRICS_PORT=0 — выключить
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Лимиты исходящих сообщений (Telegram: ~30/с на бота, ~1/с в личный чат, 20/мин в группу)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+
+# Оплаты, пришедшие в течение стольких секунд, админы получают одним сообщением
+PAYMENT_DIGEST_WINDOW = float(os.getenv("PAYMENT_DIGEST_WINDOW", "10"))
+
+# Напоминать родителю, когда у ученика осталось столько занятий или меньше.
+# Проверка раз в LOW_BALANCE_CHECK_INTERVAL секунд; 0 — выключить
+LOW_BALANCE_THRESHOLD = int(os.getenv("LOW_BALANCE_THRESHOLD", "1"))
+LOW_BALANCE_CHECK_INTERVAL = float(os.getenv("LOW_BALANCE_CHECK_INTERVAL", "3600"))
+
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_NAME = os.getenv('DB_NAME')
 DB_HOST = os.getenv('DB_HOST')
 DB_PORT = os.getenv('DB_PORT')
 
+# Больше стольких SQL-запросов на один апдейт — предупреждение в лог;
+# один и тот же запрос SQL_REPEAT_THRESHOLD раз за апдейт — подозрение на N+1
+SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "10"))
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "3"))
+# Каждый SQL-запрос в DEBUG-лог (с хендлером, временем и числом строк) — только для отладки
+SQL_LOG_STATEMENTS = os.getenv("SQL_LOG_STATEMENTS", "0") == "1"
+
+# Применять миграции схемы при запуске бота (иначе: python -m database.migrations upgrade)
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+# Пул соединений. DB_STATEMENT_CACHE_SIZE=0 нужен за pgbouncer в режиме transaction
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+engine = create_async_engine(
+    DATABASE_URL,
+    echo=False,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,  # кэш asyncpg
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,  # кэш диалекта SQLAlchemy
+    }
+)
 SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
 
 font = os.getenv('FONT')
@@ -1,60 +1,30 @@
 from aiogram.types import Message
-from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import insert
 
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, literal, any_, tuple_, exists, func, BigInteger
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import selectinload
-from sqlalchemy.inspection import inspect
 import asyncio
+import time
+from dataclasses import dataclass
 from typing import List
-from PIL import Image, ImageDraw, ImageFont
 from typing import Type
 
-from conf import Base, engine, get_db, font, logger
-from database.models import Student, Parent, Tutor, Admin, RegistrationStack, PendingPayment
+from conf import get_db, font, logger
+from database.models import Student, Parent, Tutor, Admin, RegistrationStack, PendingPayment, \
+    LessonEvent, student_tutor_association
 import database.models
+from database.migrations import apply_migrations
+from database.table_render import render_table, preview_cache, PreviewCache
+from database.table_versions import table_version, bump_table_version
 from handlers.services import save_user_image
 
 
 async def init_db():
-    import database.models
     print("🔧 Инициализация базы данных...")
-
-    try:
-        print("📡 Попытка подключения к базе...")
-        async with engine.begin() as conn:
-            print("✅ Подключение установлено")
-
-            print("📦 Импортировано таблиц:", list(Base.metadata.tables.keys()))
-            print("🛠️ Создание таблиц...")
-            await conn.run_sync(Base.metadata.create_all)
-            print("✅ Схема и таблицы успешно созданы")
-            conn.close()
-
-    except Exception as e:
-        print("❌ Ошибка при создании таблиц:", e)
-
-    async with engine.begin() as conn:
-        await conn.execute(text("""
-            ALTER TABLE students ADD COLUMN IF NOT EXISTS parent_id INTEGER;
-        """))
-        await conn.execute(text("""
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM information_schema.table_constraints
-                    WHERE constraint_name = 'fk_parent'
-                ) THEN
-                    ALTER TABLE students
-                    ADD CONSTRAINT fk_parent
-                    FOREIGN KEY (parent_id)
-                    REFERENCES parents(id)
-                    ON DELETE SET NULL;
-                END IF;
-            END
-            $$;
-        """))
+    applied = await apply_migrations()
+    print(f"✅ Применено миграций: {len(applied)}")
 
 
 async def add_stack(telegram_id: int, name: str):
@@ -88,43 +58,230 @@ async def get_students_for_tutor(telegram_id: int) -> list:
     return tutor.students if tutor else []
 
 
-async def get_unregistered_users() -> List[RegistrationStack]:
+# Версия связей преподаватель–ученик. Снимки списка учеников в FSM хранят её и
+# перечитываются, когда она меняется. Стартовое значение своё у каждого запуска бота.
+_roster_version = time.time_ns()
+
+
+def roster_version() -> int:
+    return _roster_version
+
+
+def invalidate_rosters():
+    global _roster_version
+    _roster_version += 1
+
+
+def _roster_query(telegram_id: int):
+    return (
+        select(Student.telegram_id, Student.name)
+        .join(student_tutor_association, student_tutor_association.c.student_id == Student.id)
+        .join(Tutor, Tutor.id == student_tutor_association.c.tutor_id)
+        .where(Tutor.telegram_id == telegram_id)
+        .order_by(Student.name)
+    )
+
+
+async def get_roster_for_tutor(telegram_id: int) -> list[tuple[int, str]]:
+    """
+    Компактный список (telegram_id, name) учеников преподавателя для клавиатуры отметки занятий.
+    """
     async with get_db() as db:
-        result = await db.execute(select(RegistrationStack))
-        return result.scalars().all()
+        result = await db.execute(_roster_query(telegram_id))
+        return [(row.telegram_id, row.name) for row in result]
+
+
+@dataclass
+class RegistrationPage:
+    users: List[RegistrationStack]
+    has_prev: bool
+    has_next: bool
+
+
+async def get_registration_page(
+    limit: int = 10,
+    after_id: int | None = None,
+    before_id: int | None = None
+) -> RegistrationPage | None:
+    """Страница очереди регистрации по id (keyset): after_id — вперёд, before_id — назад."""
+    stmt = select(RegistrationStack)
+    backwards = before_id is not None
+    if backwards:
+        stmt = stmt.where(RegistrationStack.id < before_id).order_by(RegistrationStack.id.desc())
+    else:
+        if after_id is not None:
+            stmt = stmt.where(RegistrationStack.id > after_id)
+        stmt = stmt.order_by(RegistrationStack.id)
+
+    async with get_db() as db:
+        users = (await db.execute(stmt.limit(limit + 1))).scalars().all()
+
+    has_more = len(users) > limit
+    users = users[:limit]
+    if not users:
+        return None
+    if backwards:
+        users.reverse()
+    return RegistrationPage(
+        users=users,
+        has_prev=has_more if backwards else after_id is not None,
+        has_next=True if backwards else has_more
+    )
+
+
+async def get_registration_entry(stack_id: int) -> RegistrationStack | None:
+    async with get_db() as db:
+        return await db.get(RegistrationStack, stack_id)
+
+
+async def promote_registration(stack_id: int, model) -> tuple[bool, str]:
+    """
+    Переносит пользователя из очереди регистрации в таблицу роли одной транзакцией:
+    DELETE из stack ... RETURNING и INSERT в таблицу роли. Если что-то не так — в stack ничего не меняется.
+    """
+    async with get_db() as db:
+        entry = (await db.execute(
+            delete(RegistrationStack)
+            .where(RegistrationStack.id == stack_id)
+            .returning(RegistrationStack.telegram_id, RegistrationStack.name)
+        )).first()
+        if entry is None:
+            return False, "Заявка уже обработана"
+
+        created = (await db.execute(
+            insert(model)
+            .values(telegram_id=entry.telegram_id, name=entry.name)
+            .on_conflict_do_nothing(index_elements=[model.telegram_id])
+            .returning(model.id)
+        )).scalar()
+        if created is None:
+            await db.rollback()
+            return False, f"Пользователь {entry.telegram_id} уже есть в таблице {model.__tablename__}"
+
+        await db.commit()
+
+    logger.info(f"Пользователь {entry.telegram_id} ({entry.name}) из очереди регистрации стал {model.__name__}")
+    return True, entry.name
+
+
+def _ids_array(ids: List[int]):
+    return literal(list(ids), ARRAY(BigInteger))
+
+
+async def _record_lesson_events(db, events: List[dict]):
+    """Пишет события в lesson_events одним INSERT в текущей транзакции."""
+    if events:
+        await db.execute(insert(LessonEvent), events)
 
 
 async def decrease_student_credit(students_ids: List[int], tutor_id: int):
+    """
+    Списывает по занятию у выбранных учеников одним UPDATE ... RETURNING.
+    Имя преподавателя читается в той же транзакции.
+    """
+    tutor_name = select(Tutor.name).where(Tutor.telegram_id == tutor_id).scalar_subquery()
     async with get_db() as db:
-        students = (await db.execute(
-            select(Student).filter(Student.telegram_id.in_(students_ids))
-        )
-                    ).scalars().all()
-        tutor_name = (await db.execute(
-            select(Tutor).filter(Tutor.telegram_id == tutor_id)
-        )
-                      ).scalars().first().name
-        for student in students:
-            student.payed_lessons -= 1
-        student_names = [student.name for student in students]
+        rows = (await db.execute(
+            update(Student)
+            .where(Student.telegram_id == any_(_ids_array(students_ids)))
+            .values(payed_lessons=Student.payed_lessons - 1)
+            .returning(Student.id, Student.name, Student.payed_lessons, tutor_name.label("tutor_name"))
+            .execution_options(synchronize_session=False)
+        )).all()
+        if rows:
+            tutor_name = rows[0].tutor_name
+        else:
+            tutor_name = (await db.execute(select(tutor_name))).scalar()
+
+        await _record_lesson_events(db, [
+            dict(student_id=row.id, kind="debit", delta=-1, balance_after=row.payed_lessons, tutor_id=tutor_id)
+            for row in rows
+        ])
         await db.commit()
+
+    student_names = [row.name for row in rows]
     return student_names, tutor_name
 
 
 async def increase_student_credit(students_id: int, admin_id: int, payed_lessons: int):
+    admin_name = select(Admin.name).where(Admin.telegram_id == admin_id).scalar_subquery()
     async with get_db() as db:
-        student = (await db.execute(
-            select(Student).filter(Student.telegram_id == students_id)
+        row = (await db.execute(
+            update(Student)
+            .where(Student.telegram_id == students_id)
+            .values(payed_lessons=Student.payed_lessons + payed_lessons, low_balance_reminded_at=None)
+            .returning(Student.id, Student.name, Student.payed_lessons, admin_name.label("admin_name"))
+            .execution_options(synchronize_session=False)
+        )).first()
+        if row is None:
+            return None, None
+
+        await _record_lesson_events(db, [dict(
+            student_id=row.id, kind="credit", delta=payed_lessons, balance_after=row.payed_lessons, admin_id=admin_id
+        )])
+        await db.commit()
+
+    return row.name, row.admin_name
+
+
+def _low_balance_query(threshold: int):
+    """Ученики с балансом <= threshold, о которых родителю ещё не напоминали, вместе с родителем."""
+    return (
+        select(Student.id, Student.name, Student.payed_lessons, Parent.telegram_id.label("parent_telegram_id"))
+        .join(Parent, Parent.id == Student.parent_id)
+        .where(
+            Student.payed_lessons <= threshold,
+            Student.low_balance_reminded_at.is_(None),
+            Student.parent_id.isnot(None)  # условие частичного индекса ix_students_low_balance_pending
         )
-                    ).scalars().first()
-        admin_name = (await db.execute(
-            select(Admin).filter(Admin.telegram_id == admin_id)
+        .order_by(Parent.telegram_id, Student.id)
+    )
+
+
+async def get_low_balance_students(threshold: int) -> dict[int, list]:
+    """Один запрос на всех: {telegram_id родителя: [строки учеников]}."""
+    async with get_db() as db:
+        rows = (await db.execute(_low_balance_query(threshold))).all()
+    by_parent = {}
+    for row in rows:
+        by_parent.setdefault(row.parent_telegram_id, []).append(row)
+    return by_parent
+
+
+async def mark_low_balance_reminded(student_ids: List[int], threshold: int):
+    """Отмечает напоминание; ученика, которому успели начислить занятия, не трогает."""
+    if not student_ids:
+        return
+    async with get_db() as db:
+        await db.execute(
+            update(Student)
+            .where(Student.id == any_(_ids_array(student_ids)), Student.payed_lessons <= threshold)
+            .values(low_balance_reminded_at=func.now())
+            .execution_options(synchronize_session=False)
         )
-                      ).scalars().first().name
-        student.payed_lessons += payed_lessons
-        student_name = student.name
         await db.commit()
-    return student_name, admin_name
+
+
+def _lesson_history_query(student_telegram_id: int, limit: int = 20, before_id: int | None = None):
+    stmt = (
+        select(LessonEvent)
+        .join(Student, Student.id == LessonEvent.student_id)
+        .where(Student.telegram_id == student_telegram_id)
+    )
+    if before_id is not None:
+        stmt = stmt.where(LessonEvent.id < before_id)
+    return stmt.order_by(LessonEvent.id.desc()).limit(limit)
+
+
+async def get_lesson_history(student_telegram_id: int, limit: int = 20,
+                             before_id: int | None = None) -> List[LessonEvent]:
+    """
+    Последние события по ученику (новые сверху). Листание — по before_id,
+    чтение идёт по индексу (student_id, id) и не зависит от размера журнала.
+    """
+    async with get_db() as db:
+        result = await db.execute(_lesson_history_query(student_telegram_id, limit, before_id))
+        return result.scalars().all()
 
 
 async def get_model_fields(model_class):
@@ -149,10 +306,17 @@ ROLE_MODEL_MAP_ENG = {
 }
 
 
-async def add_user(instance: Student | Parent | Tutor | Admin) -> tuple[bool, str]:
+async def add_user(instance: Student | Parent | Tutor | Admin, admin_id: int | None = None) -> tuple[bool, str]:
     async with get_db() as db:
         try:
             db.add(instance)
+            if isinstance(instance, Student) and instance.payed_lessons:
+                # начальный баланс — тоже начисление, иначе журнал не сойдётся с payed_lessons
+                await db.flush()
+                await _record_lesson_events(db, [{
+                    "student_id": instance.id, "kind": "credit", "delta": instance.payed_lessons,
+                    "balance_after": instance.payed_lessons, "admin_id": admin_id,
+                }])
             await db.commit()
             logger.debug(f"Добавлен {repr(instance)}")
             return True, "Объект добавлен"
@@ -185,67 +349,119 @@ async def delete_user(model, telegram_id: int, message):
         await db.delete(instance)
         await db.commit()
 
+        if model in (Tutor, Student):
+            invalidate_rosters()
+
         logger.info(f"{model.__tablename__} {telegram_id} удалён")
         await message.answer(f"✅ {telegram_id} успешно удалён из {model.__tablename__}")
 
 
-async def generate_table_image(model: Type, limit: int = 20, filename: str = "table_preview.png") -> str | None:
-    async with get_db() as session:
-        result = await session.execute(select(model).limit(limit))
-        objects = result.scalars().all()
-
-        if not objects:
-            return None
-
-        columns = [c.name for c in inspect(model).columns]
-        rows = [columns]
-
-        for obj in objects:
-            row = [str(getattr(obj, col, "")) for col in columns]
-            rows.append(row)
-
-        # Расчёт размеров
-        font_im = ImageFont.truetype(font, size=14)
-        row_height = 20
-        col_widths = [max(len(row[i]) for row in rows) * 10 for i in range(len(columns))]
-
-        img_width = sum(col_widths) + 20
-        img_height = row_height * len(rows) + 20
-
-        image = Image.new("RGB", (img_width, img_height), "white")
-        draw = ImageDraw.Draw(image)
-
-        y = 10
-        for row in rows:
-            x = 10
-            for i, cell in enumerate(row):
-                draw.text((x, y), cell, fill="black", font=font_im)
-                x += col_widths[i]
-            y += row_height
-
-        image.save(filename)
-        return filename
-
+@dataclass
+class TablePage:
+    image: bytes
+    first_id: int
+    last_id: int
+    has_prev: bool
+    has_next: bool
+
+
+def _table_columns(model: Type, columns: List[str] | None):
+    table = model.__table__
+    if not columns:
+        return list(table.columns)
+    unknown = [c for c in columns if c not in table.columns]
+    if unknown:
+        raise ValueError(f"Нет колонок {', '.join(unknown)} в таблице {table.name}")
+    # id нужен для курсора, показываем его всегда первым
+    return [table.c.id] + [table.c[c] for c in columns if c != "id"]
+
+
+async def generate_table_image(
+    model: Type,
+    limit: int = 20,
+    columns: List[str] | None = None,
+    after_id: int | None = None,
+    before_id: int | None = None,
+    name: str | None = None,
+    telegram_id: int | None = None
+) -> TablePage | None:
+    """
+    Одна страница таблицы картинкой. Листание — по id (keyset, без OFFSET):
+    after_id — следующая страница, before_id — предыдущая.
+    Рисуется в пуле процессов, страницы кэшируются до следующего изменения таблицы.
+    """
+    table_name = model.__tablename__
+    cache_key = (table_name, limit, tuple(columns or ()), after_id, before_id, name, telegram_id,
+                 table_version(table_name))
+    page = preview_cache.get(cache_key)
+    if page is not None:
+        return page
+
+    table_columns = _table_columns(model, columns)
+    id_column = model.__table__.c.id
+    stmt = select(*table_columns)
+    if name:
+        stmt = stmt.where(model.__table__.c.name.ilike(f"%{name}%"))
+    if telegram_id is not None:
+        stmt = stmt.where(model.__table__.c.telegram_id == telegram_id)
+
+    backwards = before_id is not None
+    if backwards:
+        stmt = stmt.where(id_column < before_id).order_by(id_column.desc())
+    else:
+        if after_id is not None:
+            stmt = stmt.where(id_column > after_id)
+        stmt = stmt.order_by(id_column)
 
-async def get_students_lessons_by_parent(parent_telegram_id: int):
     async with get_db() as session:
-        result = await session.execute(
-            select(Parent).where(Parent.telegram_id == parent_telegram_id)
-        )
-        parent = result.scalars().first()
-        if not parent:
-            return []
+        result = await session.execute(stmt.limit(limit + 1))
+        records = result.all()
+
+    has_more = len(records) > limit
+    records = records[:limit]
+    if not records:
+        return None
+    if backwards:
+        records.reverse()
+
+    rows = [[c.name for c in table_columns]]
+    rows.extend([str(value) for value in record] for record in records)
+
+    page = TablePage(
+        image=await render_table(rows, font),
+        first_id=records[0].id,
+        last_id=records[-1].id,
+        has_prev=has_more if backwards else after_id is not None,
+        has_next=True if backwards else has_more
+    )
+    preview_cache.put(cache_key, page)
+    return page
+
+
+# Родители жмут «Оплата» по несколько раз, пока ждут подтверждения. Ответ кэшируется на короткое время;
+# в ключ входят версии students и parents, так что любое начисление или списание в этом процессе его сбрасывает,
+# а TTL ограничивает устаревание из-за изменений из других процессов.
+PARENT_BALANCE_TTL = 30
+_parent_balance_cache = PreviewCache(max_size=512)
+
+
+async def get_students_lessons_by_parent(parent_telegram_id: int) -> List[dict]:
+    key = (parent_telegram_id, table_version(Student.__tablename__), table_version(Parent.__tablename__))
+    cached = _parent_balance_cache.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
 
-        await session.refresh(parent)  # подтягиваем связь
-        students_info = []
-        for student in parent.students:  # один-ко-многим
-            students_info.append({
-                "id": student.id,
-                "name": f"{student.name}",
-                "payed_lessons": student.payed_lessons
-            })
+    async with get_db() as db:
+        rows = (await db.execute(
+            select(Student.id, Student.name, Student.payed_lessons)
+            .join(Parent, Parent.id == Student.parent_id)
+            .where(Parent.telegram_id == parent_telegram_id)
+            .order_by(Student.id)
+        )).all()
 
-        return students_info
+    students_info = [{"id": row.id, "name": f"{row.name}", "payed_lessons": row.payed_lessons} for row in rows]
+    _parent_balance_cache.put(key, (time.monotonic() + PARENT_BALANCE_TTL, students_info))
+    return students_info
 
 
 async def create_pending_payment(
@@ -255,7 +471,7 @@ async def create_pending_payment(
     student_id: int,
     student_name: str,
     lessons: int
-):
+) -> PendingPayment:
     # Сохраняем файл и получаем путь
     file_path = await save_user_image(message)
 
@@ -267,18 +483,39 @@ async def create_pending_payment(
             student_id=student_id,
             student_name=student_name,
             lessons=lessons,
-            file_path=str(file_path)
-        )
-        await db.execute(stmt)
+            file_path=str(file_path),
+            file_id=message.photo[-1].file_id
+        ).returning(PendingPayment)
+        payment = (await db.execute(stmt)).scalar_one()
         await db.commit()
+    return payment
+
+
+def _next_pending_payment_query(created_at=None, payment_id: int | None = None):
+    """Следующая неподтверждённая заявка после курсора (created_at, id)."""
+    stmt = select(PendingPayment).where(PendingPayment.is_approved.is_(None))
+    if created_at is not None:
+        stmt = stmt.where(
+            tuple_(PendingPayment.created_at, PendingPayment.id) > tuple_(literal(created_at, PendingPayment.created_at.type), payment_id)
+        )
+    return stmt.order_by(PendingPayment.created_at, PendingPayment.id).limit(1)
 
 
-async def get_unchecked_payments():
+async def get_next_pending_payment(created_at=None, payment_id: int | None = None) -> PendingPayment | None:
     async with get_db() as db:
-        result = await db.execute(
-            select(PendingPayment).where(PendingPayment.is_approved.is_not(True))
+        return (await db.execute(_next_pending_payment_query(created_at, payment_id))).scalars().first()
+
+
+async def mark_checked_and_get_next(payment_id: int, created_at) -> PendingPayment | None:
+    """Отмечает заявку просмотренной и в той же сессии достаёт следующую за ней."""
+    async with get_db() as db:
+        await db.execute(
+            update(PendingPayment).where(PendingPayment.id == payment_id).values(is_checked=True)
         )
-        return result.scalars().all()
+        next_payment = (await db.execute(_next_pending_payment_query(created_at, payment_id))).scalars().first()
+        await db.commit()
+    logger.info(f"Платёж с ID {payment_id} просмотрен")
+    return next_payment
 
 
 async def get_pending_payment_by_id(payment_id: int):
@@ -289,6 +526,14 @@ async def get_pending_payment_by_id(payment_id: int):
         return payment
 
 
+async def set_payment_file_id(payment_id: int, file_id: str):
+    async with get_db() as db:
+        await db.execute(
+            update(PendingPayment).where(PendingPayment.id == payment_id).values(file_id=file_id)
+        )
+        await db.commit()
+
+
 async def get_parent_by_id(telegram_id):
     async with get_db() as db:
         parent = (await db.execute(select(Parent).where(Parent.telegram_id == telegram_id))).scalars().first()
@@ -297,46 +542,94 @@ async def get_parent_by_id(telegram_id):
         return parent
 
 
-async def mark_payment_as_checked(payment_id: int):
-    async with get_db() as db:
-        payment = (await db.execute(select(PendingPayment).where(PendingPayment.id == payment_id))).scalars().first()
-        if payment:
-            payment.is_checked = True
-            await db.commit()
-            logger.info(f"Платёж с ID {payment_id} просмотрен")
-
-
 async def approve_payment(payment_id: int, approver_id: int, approver_name: str):
-    async with get_db() as db:
-        payment = await db.get(PendingPayment, payment_id)
-        if payment is None:
-            return False, None, None
-
-        payment.approved_by_admin_id = approver_id
-        payment.approved_by_admin_name = approver_name
-        payment.is_approved = True
+    """
+    Подтверждает платёж одним запросом: условный UPDATE заявки (только если она ещё не обработана),
+    начисление занятий ученику и запись в lesson_events выполняются в одной транзакции.
+    Два админа не могут начислить одну и ту же оплату дважды.
+    """
+    payments = PendingPayment.__table__
+    students = Student.__table__
+
+    approved = (
+        update(payments)
+        .where(
+            payments.c.id == payment_id,
+            payments.c.is_approved.is_(None),
+            exists().where(Admin.telegram_id == approver_id),
+            exists().where(students.c.id == payments.c.student_id)
+        )
+        .values(
+            is_approved=True,
+            is_checked=True,
+            approved_by_admin_id=approver_id,
+            approved_by_admin_name=approver_name
+        )
+        .returning(payments.c.id, payments.c.student_id, payments.c.lessons)
+        .cte("approved")
+    )
+    credited = (
+        update(students)
+        .where(students.c.id == approved.c.student_id)
+        .values(payed_lessons=students.c.payed_lessons + approved.c.lessons, low_balance_reminded_at=None)
+        .returning(
+            students.c.id, students.c.name, students.c.telegram_id, students.c.payed_lessons,
+            approved.c.id.label("payment_id"), approved.c.lessons
+        )
+        .cte("credited")
+    )
+    ledger = (
+        insert(LessonEvent.__table__)
+        .from_select(
+            ["student_id", "kind", "delta", "balance_after", "admin_id", "payment_id"],
+            select(
+                credited.c.id, literal("credit"), credited.c.lessons, credited.c.payed_lessons,
+                literal(approver_id, BigInteger), credited.c.payment_id
+            )
+        )
+        .returning(LessonEvent.id)
+        .cte("ledger")
+    )
+    admin_name = select(Admin.name).where(Admin.telegram_id == approver_id).scalar_subquery()
 
-        student = (
-            await db.execute(select(Student).where(Student.id == payment.student_id))
-        ).scalars().first()
+    async with get_db() as db:
+        student = (await db.execute(
+            select(credited.c.name, credited.c.telegram_id, credited.c.lessons, admin_name.label("admin_name"))
+            .add_cte(ledger)
+        )).first()
+        await db.commit()
 
-        admin = (
-            await db.execute(select(Admin).where(Admin.telegram_id == approver_id))
-        ).scalars().first()
+    if student is None:
+        logger.warning(f"Платёж #{payment_id} не подтверждён: уже обработан, не найден, "
+                       f"или нет админа {approver_id} / ученика")
+        return False, None, None
 
-        if student is None or admin is None:
-            if student is None:
-                print(f"[ERROR] Student not found with telegram_id: {payment.student_id}")
-            if admin is None:
-                print(f"[ERROR] Admin not found with telegram_id: {approver_id}")
-            return False, None, None
+    bump_table_version(payments.name, students.name, LessonEvent.__tablename__)
+    logger.info(f"Платёж #{payment_id} подтверждён админом {approver_name} (ID {approver_id}); "
+                f"{student.lessons} уроков начислено студенту {student.name} (ID {student.telegram_id})")
+    return True, student.name, student.admin_name
 
-        student.payed_lessons += payment.lessons
 
+async def decline_payment(payment_id: int, approver_id: int, approver_name: str):
+    """Отклоняет ещё не обработанный платёж. Возвращает заявку или None, если её уже обработали."""
+    async with get_db() as db:
+        payment = (await db.execute(
+            update(PendingPayment)
+            .where(PendingPayment.id == payment_id, PendingPayment.is_approved.is_(None))
+            .values(
+                is_approved=False,
+                is_checked=True,
+                approved_by_admin_id=approver_id,
+                approved_by_admin_name=approver_name
+            )
+            .returning(PendingPayment.parent_id, PendingPayment.student_name, PendingPayment.lessons)
+            .execution_options(synchronize_session=False)
+        )).first()
         await db.commit()
-        print(f"[INFO] Платёж #{payment_id} подтверждён админом {approver_name} (ID {approver_id}); "
-              f"{payment.lessons} уроков начислено студенту {student.name} (ID {student.telegram_id})")
-        return True, student.name, admin.name
+
+    if payment is not None:
+        logger.info(f"Платёж #{payment_id} отклонён админом {approver_name} (ID {approver_id})")
+    return payment
 
 
 
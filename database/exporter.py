@@ -0,0 +1,54 @@
+"""
+Выгрузка таблиц целиком в CSV (gzip).
+
+Строки читаются серверным курсором (AsyncSession.stream) пачками по EXPORT_CHUNK_SIZE
+и сразу дописываются в файл из потока, поэтому память не зависит от размера таблицы,
+а event loop не ждёт сжатия и записи на диск.
+"""
+import asyncio
+import csv
+import gzip
+from pathlib import Path
+from typing import Type
+
+from sqlalchemy import select
+
+from conf import get_db, logger
+from database.db_scripts import ROLE_MODEL_MAP_ENG
+from database.models import LessonEvent, PendingPayment, RegistrationStack
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_MODEL_MAP = {
+    **ROLE_MODEL_MAP_ENG,
+    "LessonEvent": LessonEvent,
+    "PendingPayment": PendingPayment,
+    "RegistrationStack": RegistrationStack,
+}
+
+
+async def export_table_csv(model: Type, path: Path, chunk_size: int = EXPORT_CHUNK_SIZE) -> int:
+    """Пишет всю таблицу модели в path (.csv.gz). Возвращает число строк."""
+    columns = list(model.__table__.columns)
+    stmt = (
+        select(*columns)
+        .order_by(model.__table__.c.id)
+        .execution_options(yield_per=chunk_size)
+    )
+
+    rows_written = 0
+    # открытие и закрытие файла — мгновенные, тяжёлая часть (сжатие и запись пачек) уходит в поток
+    f = gzip.open(path, "wt", newline="", encoding="utf-8")
+    try:
+        writer = csv.writer(f)
+        writer.writerow([c.name for c in columns])
+        async with get_db() as db:
+            result = await db.stream(stmt)
+            async for partition in result.partitions():
+                await asyncio.to_thread(writer.writerows, partition)
+                rows_written += len(partition)
+    finally:
+        await asyncio.to_thread(f.close)
+
+    logger.info(f"Выгрузка {model.__tablename__}: {rows_written} строк в {path}")
+    return rows_written
@@ -0,0 +1,135 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseEventIsolation, BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, \
+    StorageKey
+from aiogram.fsm.storage.memory import SimpleEventIsolation
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from conf import get_db
+from database.models import FSMRecord
+
+
+@dataclass
+class _Entry:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    loaded: bool = False
+    dirty: set = field(default_factory=set)
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_states.
+
+    Внутри scope() (открывается на время апдейта через UpdateScopeIsolation) чтения кэшируются,
+    а все set_state/set_data/update_data копятся в памяти и сбрасываются одним upsert на ключ.
+    Вне scope() каждая операция сразу пишет в БД.
+    """
+
+    def __init__(self, key_builder: KeyBuilder | None = None):
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._entries: ContextVar[Optional[Dict[str, _Entry]]] = ContextVar("fsm_entries", default=None)
+
+    @asynccontextmanager
+    async def scope(self) -> AsyncGenerator[None, None]:
+        if self._entries.get() is not None:
+            yield
+            return
+
+        entries: Dict[str, _Entry] = {}
+        token = self._entries.set(entries)
+        try:
+            yield
+        finally:
+            self._entries.reset(token)
+            await self._flush(entries)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        async with self.scope():
+            entry = await self._entry(key, load=False)
+            entry.state = state.state if isinstance(state, State) else state
+            entry.dirty.add("state")
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        async with self.scope():
+            return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        async with self.scope():
+            entry = await self._entry(key, load=False)
+            entry.data = dict(data)
+            entry.dirty.add("data")
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        async with self.scope():
+            return (await self._entry(key)).data.copy()
+
+    async def close(self) -> None:
+        pass
+
+    async def _entry(self, key: StorageKey, load: bool = True) -> _Entry:
+        entries = self._entries.get()
+        str_key = self.key_builder.build(key)
+        entry = entries.setdefault(str_key, _Entry())
+
+        if load and not entry.loaded:
+            async with get_db() as db:
+                row = (await db.execute(
+                    select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == str_key)
+                )).first()
+            # не затираем то, что уже изменили в этом апдейте
+            if row is not None:
+                if "state" not in entry.dirty:
+                    entry.state = row.state
+                if "data" not in entry.dirty:
+                    entry.data = dict(row.data or {})
+            entry.loaded = True
+        return entry
+
+    @staticmethod
+    async def _flush(entries: Dict[str, _Entry]):
+        dirty = {key: entry for key, entry in entries.items() if entry.dirty}
+        if not dirty:
+            return
+
+        async with get_db() as db:
+            for key, entry in dirty.items():
+                is_empty = entry.state is None and not entry.data
+                if is_empty and (entry.loaded or entry.dirty == {"state", "data"}):
+                    await db.execute(delete(FSMRecord).where(FSMRecord.key == key))
+                    continue
+
+                values = {name: getattr(entry, name) for name in entry.dirty}
+                stmt = insert(FSMRecord).values(key=key, **values)
+                await db.execute(stmt.on_conflict_do_update(
+                    index_elements=[FSMRecord.key],
+                    set_={**{name: stmt.excluded[name] for name in entry.dirty}, "updated_at": stmt.excluded.updated_at}
+                ))
+            await db.commit()
+        for entry in dirty.values():
+            entry.dirty.clear()
+
+
+class UpdateScopeIsolation(BaseEventIsolation):
+    """
+    Изоляция событий, которая на время обработки апдейта открывает буфер PostgresStorage.
+    Апдейты одного пользователя обрабатываются последовательно (SimpleEventIsolation).
+    """
+
+    def __init__(self, storage: PostgresStorage, inner: BaseEventIsolation | None = None):
+        self.storage = storage
+        self.inner = inner or SimpleEventIsolation()
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        async with self.inner.lock(key):
+            async with self.storage.scope():
+                yield
+
+    async def close(self) -> None:
+        await self.inner.close()
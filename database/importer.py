@@ -0,0 +1,285 @@
+"""
+Массовый импорт пользователей из CSV/XLSX.
+
+Колонки (первая строка — заголовок):
+    kind                 student | parent | tutor | link
+    telegram_id          telegram_id пользователя (для link — ученика)
+    name                 имя (не нужно для link)
+    payed_lessons        только student, целое, по умолчанию 0; новым ученикам пишется в lesson_events
+    parent_telegram_id   только student, родитель должен быть в базе или выше в файле
+    tutor_telegram_id    link, или student — сразу привязать к преподавателю
+
+Файл читается построчно в отдельном потоке, строки пишутся пачками по IMPORT_BATCH_SIZE
+через INSERT ... ON CONFLICT DO NOTHING: уже существующие пользователи и связи пропускаются.
+"""
+import asyncio
+import csv
+import io
+import itertools
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+from openpyxl import load_workbook
+from sqlalchemy import select, any_, literal
+from sqlalchemy.dialects.postgresql import insert
+
+from conf import get_db, logger
+from database.db_scripts import _ids_array, invalidate_rosters
+from database.models import Student, Parent, Tutor, LessonEvent, student_tutor_association
+from database.table_versions import bump_table_version
+
+IMPORT_BATCH_SIZE = 1000
+KIND_MODELS = {"student": Student, "parent": Parent, "tutor": Tutor}
+# Порядок записи внутри пачки: сначала те, на кого ссылаются
+FLUSH_ORDER = ("parent", "tutor", "student", "link")
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    inserted: Counter = field(default_factory=Counter)
+    skipped: Counter = field(default_factory=Counter)
+    errors: list[tuple[int, str]] = field(default_factory=list)
+
+    def error(self, line: int, text: str):
+        self.errors.append((line, text))
+
+    def summary(self) -> str:
+        lines = [f"📥 Обработано строк: {self.rows}"]
+        for kind in FLUSH_ORDER:
+            if self.inserted[kind] or self.skipped[kind]:
+                lines.append(f"• {kind}: добавлено {self.inserted[kind]}, уже были {self.skipped[kind]}")
+        lines.append(f"❌ Ошибок: {len(self.errors)}")
+        return "\n".join(lines)
+
+    def errors_csv(self) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["line", "error"])
+        writer.writerows(self.errors)
+        return buffer.getvalue().encode("utf-8-sig")
+
+
+def _iter_csv(path: Path) -> Iterator[dict]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        for row in csv.DictReader(f, dialect=dialect):
+            yield {(key or "").strip().lower(): value for key, value in row.items()}
+
+
+def _iter_xlsx(path: Path) -> Iterator[dict]:
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell or "").strip().lower() for cell in next(rows, ())]
+        for values in rows:
+            yield {key: "" if value is None else str(value) for key, value in zip(header, values)}
+    finally:
+        workbook.close()
+
+
+def iter_import_rows(path: Path) -> Iterator[dict]:
+    if path.suffix.lower() == ".xlsx":
+        return _iter_xlsx(path)
+    if path.suffix.lower() in (".csv", ".txt"):
+        return _iter_csv(path)
+    raise ValueError("Поддерживаются только .csv и .xlsx")
+
+
+def _int(raw: dict, key: str, required: bool = False) -> int | None:
+    value = (raw.get(key) or "").strip()
+    if not value:
+        if required:
+            raise ValueError(f"не заполнено {key}")
+        return None
+    try:
+        if "." not in value:
+            return int(value)
+        # XLSX отдаёт целые числа как 123.0, а 1.5 — не целое, молча округлять нельзя
+        number = float(value)
+        if number.is_integer():
+            return int(number)
+    except ValueError:
+        pass
+    raise ValueError(f"{key}: ожидалось целое число, получено {value!r}")
+
+
+def parse_import_row(raw: dict) -> tuple[str, dict]:
+    """Проверяет строку файла. Возвращает (kind, значения) или бросает ValueError с понятным текстом."""
+    kind = (raw.get("kind") or "").strip().lower()
+    if kind not in (*KIND_MODELS, "link"):
+        raise ValueError(f"kind должен быть одним из {', '.join((*KIND_MODELS, 'link'))}, получено {kind!r}")
+
+    row = {"telegram_id": _int(raw, "telegram_id", required=True)}
+    if kind == "link":
+        row["tutor_telegram_id"] = _int(raw, "tutor_telegram_id", required=True)
+        return kind, row
+
+    row["name"] = (raw.get("name") or "").strip()
+    if not row["name"]:
+        raise ValueError("не заполнено name")
+    if kind == "student":
+        row["payed_lessons"] = _int(raw, "payed_lessons") or 0
+        if row["payed_lessons"] < 0:
+            raise ValueError("payed_lessons не может быть отрицательным")
+        row["parent_telegram_id"] = _int(raw, "parent_telegram_id")
+        row["tutor_telegram_id"] = _int(raw, "tutor_telegram_id")
+    return kind, row
+
+
+async def _id_map(db, model, telegram_ids) -> dict[int, int]:
+    if not telegram_ids:
+        return {}
+    result = await db.execute(
+        select(model.telegram_id, model.id).where(model.telegram_id == any_(_ids_array(telegram_ids)))
+    )
+    return dict(result.all())
+
+
+def _with_opening_balances(stmt):
+    """
+    INSERT учеников и запись в lesson_events одним запросом: каждому новому ученику
+    с payed_lessons > 0 — событие credit на начальный баланс, чтобы журнал сходился с балансом.
+    """
+    inserted = stmt.returning(Student.id, Student.telegram_id, Student.payed_lessons).cte("inserted_students")
+    ledger = (
+        insert(LessonEvent.__table__)
+        .from_select(
+            ["student_id", "kind", "delta", "balance_after"],
+            select(inserted.c.id, literal("credit"), inserted.c.payed_lessons, inserted.c.payed_lessons)
+            .where(inserted.c.payed_lessons > 0)
+        )
+        .returning(LessonEvent.id)
+        .cte("opening_balances")
+    )
+    return select(inserted.c.telegram_id).add_cte(ledger)
+
+
+class Importer:
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.report = ImportReport()
+        self._buffers: dict[str, list[tuple[int, dict]]] = {kind: [] for kind in FLUSH_ORDER}
+        self._buffered = 0
+        self._seen: dict[str, set] = {kind: set() for kind in FLUSH_ORDER}
+
+    async def add(self, line: int, raw: dict):
+        self.report.rows += 1
+        try:
+            kind, row = parse_import_row(raw)
+        except ValueError as e:
+            self.report.error(line, str(e))
+            return
+        self._buffers[kind].append((line, row))
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffered:
+            return
+        async with get_db() as db:
+            for kind in ("parent", "tutor"):
+                await self._insert_users(db, kind, self._buffers[kind])
+            await self._insert_students(db, self._buffers["student"])
+            await self._insert_links(db, self._buffers["link"])
+            await db.commit()
+        if self._buffers["student"]:
+            # INSERT внутри CTE не виден автоматическому учёту изменённых таблиц
+            bump_table_version(Student.__tablename__, LessonEvent.__tablename__)
+        for buffer in self._buffers.values():
+            buffer.clear()
+        self._buffered = 0
+
+    async def _insert_users(self, db, kind: str, items: list[tuple[int, dict]], extra=None):
+        if not items:
+            return
+        model = KIND_MODELS[kind]
+        values = [{"telegram_id": row["telegram_id"], "name": row["name"], **(extra(row) if extra else {})}
+                  for _, row in items]
+        stmt = insert(model).values(values).on_conflict_do_nothing(index_elements=[model.telegram_id])
+        if model is Student:
+            stmt = _with_opening_balances(stmt)
+        else:
+            stmt = stmt.returning(model.telegram_id)
+        inserted = set((await db.execute(stmt)).scalars())
+
+        seen = self._seen[kind]
+        for _, row in items:
+            if row["telegram_id"] in inserted and row["telegram_id"] not in seen:
+                self.report.inserted[kind] += 1
+            else:
+                self.report.skipped[kind] += 1
+            seen.add(row["telegram_id"])
+
+    async def _insert_students(self, db, items: list[tuple[int, dict]]):
+        if not items:
+            return
+        parents = await _id_map(db, Parent, {row["parent_telegram_id"] for _, row in items if row["parent_telegram_id"]})
+        for line, row in items:
+            if row["parent_telegram_id"] and row["parent_telegram_id"] not in parents:
+                self.report.error(line, f"родитель {row['parent_telegram_id']} не найден, ученик добавлен без родителя")
+            if row["tutor_telegram_id"]:
+                self._buffers["link"].append((line, row))
+
+        await self._insert_users(db, "student", items, extra=lambda row: {
+            "payed_lessons": row["payed_lessons"],
+            "parent_id": parents.get(row["parent_telegram_id"]),
+            "is_admin": False,
+        })
+
+    async def _insert_links(self, db, items: list[tuple[int, dict]]):
+        if not items:
+            return
+        students = await _id_map(db, Student, {row["telegram_id"] for _, row in items})
+        tutors = await _id_map(db, Tutor, {row["tutor_telegram_id"] for _, row in items})
+
+        values = {}
+        for line, row in items:
+            student_id = students.get(row["telegram_id"])
+            tutor_id = tutors.get(row["tutor_telegram_id"])
+            if student_id is None:
+                self.report.error(line, f"ученик {row['telegram_id']} не найден, связь не создана")
+            elif tutor_id is None:
+                self.report.error(line, f"преподаватель {row['tutor_telegram_id']} не найден, связь не создана")
+            else:
+                values[(student_id, tutor_id)] = {"student_id": student_id, "tutor_id": tutor_id}
+        if not values:
+            return
+
+        created = len((await db.execute(
+            insert(student_tutor_association).values(list(values.values()))
+            .on_conflict_do_nothing()
+            .returning(student_tutor_association.c.student_id)
+        )).all())
+        self.report.inserted["link"] += created
+        self.report.skipped["link"] += len(values) - created
+
+
+def _read_chunk(rows: Iterator[dict], size: int) -> list[dict]:
+    return list(itertools.islice(rows, size))
+
+
+async def import_users(path: Path, batch_size: int = IMPORT_BATCH_SIZE) -> ImportReport:
+    """Импортирует файл. Чтение и разбор — в потоке, чтобы не держать event loop на больших XLSX."""
+    rows = iter_import_rows(path)
+    importer = Importer(batch_size)
+    line = 1  # первая строка — заголовок
+    while chunk := await asyncio.to_thread(_read_chunk, rows, batch_size):
+        for raw in chunk:
+            line += 1
+            await importer.add(line, raw)
+    await importer.flush()
+
+    if importer.report.inserted["link"]:
+        invalidate_rosters()
+    logger.info(f"Импорт {path.name}: {importer.report.rows} строк, добавлено {dict(importer.report.inserted)}, "
+                f"ошибок {len(importer.report.errors)}")
+    return importer.report
@@ -0,0 +1,110 @@
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from conf import SQL_QUERY_BUDGET, SQL_REPEAT_THRESHOLD, SQL_LOG_STATEMENTS, logger
+
+BEFORE_HANDLER = "<до хендлера>"
+
+
+@dataclass
+class UpdateQueryStats:
+    """SQL-запросы одного апдейта: сколько, сколько времени, сколько строк и от какого хендлера."""
+    update: str
+    handler: str = BEFORE_HANDLER
+    queries: int = 0
+    duration: float = 0.0
+    rows: int = 0
+    by_handler: Counter = field(default_factory=Counter)
+    statements: Counter = field(default_factory=Counter)
+
+    def repeated(self, threshold: int = SQL_REPEAT_THRESHOLD) -> list[tuple[str, int]]:
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+@dataclass
+class HandlerQueryTotals:
+    updates: int = 0
+    queries: int = 0
+    duration: float = 0.0
+    rows: int = 0
+
+
+_current: ContextVar[UpdateQueryStats | None] = ContextVar("sql_update_stats", default=None)
+
+# Накопленные итоги по хендлерам за время работы процесса (читает экспортёр метрик)
+handler_totals: defaultdict[str, HandlerQueryTotals] = defaultdict(HandlerQueryTotals)
+
+
+def start_update(update: str):
+    return _current.set(UpdateQueryStats(update=update))
+
+
+def set_handler(name: str):
+    stats = _current.get()
+    if stats is not None:
+        stats.handler = name
+
+
+def current_stats() -> UpdateQueryStats | None:
+    return _current.get()
+
+
+def finish_update(token) -> UpdateQueryStats | None:
+    stats = _current.get()
+    _current.reset(token)
+    if stats is None:
+        return None
+
+    totals = handler_totals[stats.handler]
+    totals.updates += 1
+    totals.queries += stats.queries
+    totals.duration += stats.duration
+    totals.rows += stats.rows
+
+    if stats.queries > SQL_QUERY_BUDGET:
+        logger.warning(
+            f"{stats.update} → {stats.handler}: {stats.queries} SQL-запросов "
+            f"(бюджет {SQL_QUERY_BUDGET}), {stats.duration * 1000:.1f} мс; по хендлерам: {dict(stats.by_handler)}"
+        )
+    for sql, count in stats.repeated():
+        logger.warning(f"N+1 в {stats.update} → {stats.handler}: запрос выполнен {count} раз: {' '.join(sql.split())[:200]}")
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    if stats is None:
+        return
+
+    stats.queries += 1
+    stats.duration += elapsed
+    stats.rows += max(cursor.rowcount, 0)
+    stats.by_handler[stats.handler] += 1
+    stats.statements[statement] += 1
+    if SQL_LOG_STATEMENTS:
+        logger.debug(f"SQL [{stats.handler}] {elapsed * 1000:.1f} мс, {cursor.rowcount} строк: {' '.join(statement.split())[:120]}")
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute на упавшем запросе не вызывается — снимаем его отметку времени сами
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_start"):
+        connection.info["query_start"].pop()
+
+
+def install_sql_instrumentation(engine: AsyncEngine | Engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
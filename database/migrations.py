@@ -0,0 +1,347 @@
+"""
+Версионные миграции схемы.
+
+Каждая миграция применяется один раз и записывается в schema_migrations.
+Миграции — явный DDL, а не create_all по текущим моделям: схема, которую создаёт
+миграция N, не меняется, когда модели дописывают. Новая таблица или колонка —
+всегда новая миграция (и тест tests/test_migrations.py напомнит, если её забыли).
+Все шаги идемпотентны (IF NOT EXISTS), так что база, поднятая старым init_db,
+доводится до актуальной схемы без ручных правок.
+
+    python -m database.migrations upgrade   # применить новые миграции
+    python -m database.migrations status    # что уже применено
+    python -m database.migrations check     # EXPLAIN горячих запросов, падает на Seq Scan
+"""
+import asyncio
+import sys
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from conf import engine, logger
+
+# Ключ pg_advisory_xact_lock, чтобы два процесса не мигрировали одновременно
+MIGRATIONS_LOCK_KEY = 7_310_514
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    statements: tuple[str, ...] = ()
+
+
+MIGRATIONS = (
+    Migration(
+        version=1,
+        name="baseline",
+        # схема, с которой бот жил до миграций; всё, что появилось позже, — в следующих версиях
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS parents (
+                id SERIAL PRIMARY KEY,
+                telegram_id BIGINT NOT NULL UNIQUE,
+                name VARCHAR
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS students (
+                id SERIAL PRIMARY KEY,
+                telegram_id BIGINT NOT NULL UNIQUE,
+                name VARCHAR,
+                is_admin BOOLEAN NOT NULL,
+                payed_lessons INTEGER NOT NULL,
+                parent_id INTEGER
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS tutors (
+                id SERIAL PRIMARY KEY,
+                telegram_id BIGINT NOT NULL UNIQUE,
+                name VARCHAR,
+                is_admin BOOLEAN NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS admins (
+                id SERIAL PRIMARY KEY,
+                telegram_id BIGINT NOT NULL UNIQUE,
+                name VARCHAR,
+                is_admin BOOLEAN NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS stack (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR,
+                telegram_id BIGINT NOT NULL UNIQUE,
+                fullname VARCHAR
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS pending_payments (
+                id SERIAL PRIMARY KEY,
+                parent_id BIGINT NOT NULL,
+                parent_name VARCHAR NOT NULL,
+                student_id BIGINT NOT NULL,
+                student_name VARCHAR NOT NULL,
+                lessons INTEGER NOT NULL,
+                file_path VARCHAR NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                is_checked BOOLEAN,
+                is_approved BOOLEAN,
+                approved_by_admin_id BIGINT,
+                approved_by_admin_name VARCHAR
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS student_tutor (
+                student_id INTEGER REFERENCES students (id),
+                tutor_id INTEGER REFERENCES tutors (id)
+            )
+            """,
+            "ALTER TABLE students ADD COLUMN IF NOT EXISTS parent_id INTEGER",
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_constraint
+                    WHERE conrelid = 'students'::regclass
+                      AND confrelid = 'parents'::regclass
+                      AND contype = 'f'
+                ) THEN
+                    ALTER TABLE students
+                    ADD CONSTRAINT fk_parent
+                    FOREIGN KEY (parent_id)
+                    REFERENCES parents(id)
+                    ON DELETE SET NULL;
+                END IF;
+            END
+            $$;
+            """,
+        ),
+    ),
+    Migration(
+        version=2,
+        name="student_tutor_primary_key",
+        statements=(
+            # дубли и пустые связи мешают первичному ключу
+            "DELETE FROM student_tutor WHERE student_id IS NULL OR tutor_id IS NULL",
+            """
+            DELETE FROM student_tutor a
+            USING student_tutor b
+            WHERE a.ctid < b.ctid AND a.student_id = b.student_id AND a.tutor_id = b.tutor_id
+            """,
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT 1 FROM pg_constraint
+                    WHERE conrelid = 'student_tutor'::regclass AND contype = 'p'
+                ) THEN
+                    ALTER TABLE student_tutor ADD CONSTRAINT student_tutor_pkey PRIMARY KEY (student_id, tutor_id);
+                END IF;
+            END
+            $$;
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_student_tutor_tutor_id_student_id ON student_tutor (tutor_id, student_id)",
+        ),
+    ),
+    Migration(
+        version=3,
+        name="fsm_states_lesson_events_and_indexes",
+        statements=(
+            """
+            CREATE TABLE IF NOT EXISTS fsm_states (
+                key VARCHAR PRIMARY KEY,
+                state VARCHAR,
+                data JSONB NOT NULL DEFAULT '{}'::jsonb,
+                updated_at TIMESTAMPTZ DEFAULT now()
+            )
+            """,
+            # в исходном виде (CASCADE, NOT NULL) — миграция 5 переводит его на SET NULL
+            """
+            CREATE TABLE IF NOT EXISTS lesson_events (
+                id BIGSERIAL PRIMARY KEY,
+                student_id INTEGER NOT NULL REFERENCES students (id) ON DELETE CASCADE,
+                kind VARCHAR NOT NULL,
+                delta INTEGER NOT NULL,
+                balance_after INTEGER NOT NULL,
+                tutor_id BIGINT,
+                admin_id BIGINT,
+                payment_id INTEGER REFERENCES pending_payments (id) ON DELETE SET NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_students_parent_id ON students (parent_id)",
+            """
+            CREATE INDEX IF NOT EXISTS ix_pending_payments_unapproved
+            ON pending_payments (created_at, id) WHERE is_approved IS NULL
+            """,
+            "CREATE INDEX IF NOT EXISTS ix_lesson_events_student_id_id ON lesson_events (student_id, id)",
+        ),
+    ),
+    Migration(
+        version=4,
+        name="low_balance_reminders",
+        statements=(
+            "ALTER TABLE students ADD COLUMN IF NOT EXISTS low_balance_reminded_at TIMESTAMPTZ",
+            """
+            CREATE INDEX IF NOT EXISTS ix_students_low_balance_pending
+            ON students (payed_lessons) WHERE low_balance_reminded_at IS NULL AND parent_id IS NOT NULL
+            """,
+        ),
+    ),
+    Migration(
+        version=5,
+        name="lesson_events_keep_history",
+        statements=(
+            # журнал не должен исчезать вместе с учеником: CASCADE -> SET NULL
+            "ALTER TABLE lesson_events ALTER COLUMN student_id DROP NOT NULL",
+            "ALTER TABLE lesson_events DROP CONSTRAINT IF EXISTS lesson_events_student_id_fkey",
+            """
+            ALTER TABLE lesson_events ADD CONSTRAINT lesson_events_student_id_fkey
+            FOREIGN KEY (student_id) REFERENCES students (id) ON DELETE SET NULL
+            """,
+        ),
+    ),
+    Migration(
+        version=6,
+        name="pending_payments_file_id",
+        statements=(
+            # file_id фото в Telegram; на базах, где миграция 1 ещё добавляла колонку, ничего не делает
+            "ALTER TABLE pending_payments ADD COLUMN IF NOT EXISTS file_id VARCHAR",
+        ),
+    ),
+    Migration(
+        version=7,
+        name="students_single_parent_fk",
+        statements=(
+            # старый init_db создавал и students_parent_id_fkey без ON DELETE, и fk_parent:
+            # первый не даёт удалить родителя, и SET NULL второго не срабатывает
+            "ALTER TABLE students DROP CONSTRAINT IF EXISTS students_parent_id_fkey",
+            "ALTER TABLE students DROP CONSTRAINT IF EXISTS fk_parent",
+            """
+            ALTER TABLE students ADD CONSTRAINT fk_parent
+            FOREIGN KEY (parent_id) REFERENCES parents (id) ON DELETE SET NULL
+            """,
+        ),
+    ),
+)
+
+
+async def _ensure_migrations_table(conn):
+    await conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """))
+
+
+async def applied_versions() -> dict[int, str]:
+    async with engine.begin() as conn:
+        await _ensure_migrations_table(conn)
+        result = await conn.execute(text("SELECT version, name FROM schema_migrations ORDER BY version"))
+        return {row.version: row.name for row in result}
+
+
+async def apply_migrations() -> list[int]:
+    """Применяет все ещё не применённые миграции в одной транзакции. Возвращает их версии."""
+    applied_now = []
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+        await _ensure_migrations_table(conn)
+        applied = set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+
+        for migration in MIGRATIONS:
+            if migration.version in applied:
+                continue
+            logger.info(f"Миграция {migration.version}: {migration.name}")
+            for statement in migration.statements:
+                await conn.execute(text(statement))
+            await conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": migration.version, "name": migration.name}
+            )
+            applied_now.append(migration.version)
+
+    return applied_now
+
+
+def hot_queries() -> dict[str, object]:
+    """Запросы из горячих путей бота, которые обязаны идти по индексам."""
+    from sqlalchemy import select
+
+    from database.db_scripts import _roster_query, _next_pending_payment_query, _low_balance_query, \
+        _lesson_history_query
+    from database.models import Student, Parent
+    from handlers.services import role_query
+
+    return {
+        "role_query": role_query(0),
+        "tutor_roster": _roster_query(0),
+        "parent_students": (
+            select(Student.id, Student.name, Student.payed_lessons)
+            .join(Parent, Parent.id == Student.parent_id)
+            .where(Parent.telegram_id == 0)
+        ),
+        "next_pending_payment": _next_pending_payment_query(),
+        "lesson_history": _lesson_history_query(0),
+        "low_balance_students": _low_balance_query(1),
+    }
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", ()):
+        found.extend(_seq_scans(child))
+    return found
+
+
+async def check_query_plans() -> dict[str, list[str]]:
+    """
+    EXPLAIN каждого горячего запроса с enable_seqscan = off: если планировщик всё равно
+    выбирает Seq Scan, подходящего индекса нет. Возвращает {запрос: [таблицы с Seq Scan]}.
+    """
+    dialect = postgresql.dialect()
+    problems = {}
+    async with engine.begin() as conn:
+        await conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, query in hot_queries().items():
+            sql = str(query.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+            plan = (await conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+            tables = _seq_scans(plan[0]["Plan"])
+            if tables:
+                problems[name] = tables
+    return problems
+
+
+async def _main(command: str) -> int:
+    if command == "upgrade":
+        applied = await apply_migrations()
+        print(f"Применено миграций: {len(applied)} {applied or ''}")
+    elif command == "status":
+        applied = await applied_versions()
+        for migration in MIGRATIONS:
+            mark = "x" if migration.version in applied else " "
+            print(f"[{mark}] {migration.version:03d} {migration.name}")
+    elif command == "check":
+        problems = await check_query_plans()
+        for name, tables in problems.items():
+            print(f"❌ {name}: Seq Scan по {', '.join(tables)}")
+        if problems:
+            return 1
+        print("✅ Все горячие запросы используют индексы")
+    else:
+        print(__doc__)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "upgrade")))
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Table, Boolean, DateTime, func
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, Table, Boolean, DateTime, func, text, \
+    Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from conf import Base
 
@@ -6,8 +8,9 @@ from conf import Base
 student_tutor_association = Table(
     'student_tutor',
     Base.metadata,
-    Column('student_id', Integer, ForeignKey('students.id')),
-    Column('tutor_id', Integer, ForeignKey('tutors.id'))
+    Column('student_id', Integer, ForeignKey('students.id'), primary_key=True),
+    Column('tutor_id', Integer, ForeignKey('tutors.id'), primary_key=True),
+    Index('ix_student_tutor_tutor_id_student_id', 'tutor_id', 'student_id')
 )
 
 
@@ -28,14 +31,23 @@ class ReprMixin:
 
 class Student(Base, ReprMixin):
     __tablename__ = 'students'
+    __table_args__ = (
+        # напоминания о балансе: WHERE payed_lessons <= порог AND ещё не напоминали
+        Index(
+            "ix_students_low_balance_pending", "payed_lessons",
+            postgresql_where=text("low_balance_reminded_at IS NULL AND parent_id IS NOT NULL")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)  # внутренний ID
     telegram_id = Column(BigInteger, unique=True, nullable=False)
     name = Column(String)
     is_admin = Column(Boolean, default=False, nullable=False)
     payed_lessons = Column(Integer, default=0, nullable=False)
+    # когда родителю напомнили о заканчивающихся занятиях; сбрасывается при начислении
+    low_balance_reminded_at = Column(DateTime(timezone=True), nullable=True)
 
-    parent_id = Column(Integer, ForeignKey('parents.id'), nullable=True)
+    parent_id = Column(Integer, ForeignKey('parents.id', ondelete='SET NULL'), nullable=True, index=True)
     parent = relationship("Parent", back_populates="students")
 
     tutors = relationship(
@@ -87,6 +99,10 @@ class RegistrationStack(Base, ReprMixin):
 
 class PendingPayment(Base):
     __tablename__ = "pending_payments"
+    __table_args__ = (
+        # очередь на проверку: WHERE is_approved IS NULL ORDER BY created_at, id
+        Index("ix_pending_payments_unapproved", "created_at", "id", postgresql_where=text("is_approved IS NULL")),
+    )
 
     id = Column(Integer, primary_key=True)
     parent_id = Column(BigInteger, nullable=False)
@@ -95,6 +111,7 @@ class PendingPayment(Base):
     student_name = Column(String, nullable=False)
     lessons = Column(Integer, nullable=False)
     file_path = Column(String, nullable=False)
+    file_id = Column(String, nullable=True)  # file_id фото в Telegram, чтобы не загружать его заново
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     is_checked = Column(Boolean, default=False)
@@ -103,6 +120,33 @@ class PendingPayment(Base):
     approved_by_admin_name = Column(String, nullable=True)
 
 
+class FSMRecord(Base):
+    __tablename__ = "fsm_states"
 
+    key = Column(String, primary_key=True)  # ключ из DefaultKeyBuilder
+    state = Column(String, nullable=True)
+    data = Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
+class LessonEvent(Base):
+    """
+    Журнал начислений и списаний занятий (только добавление).
+    Баланс ученика хранится в students.payed_lessons и меняется в той же транзакции,
+    что и запись сюда, поэтому журнал никогда не нужно пересчитывать.
+    """
+    __tablename__ = "lesson_events"
+    __table_args__ = (
+        Index("ix_lesson_events_student_id_id", "student_id", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # при удалении ученика история остаётся, теряется только ссылка на него
+    student_id = Column(Integer, ForeignKey("students.id", ondelete="SET NULL"), nullable=True)
+    kind = Column(String, nullable=False)  # 'credit' | 'debit'
+    delta = Column(Integer, nullable=False)
+    balance_after = Column(Integer, nullable=False)
+    tutor_id = Column(BigInteger, nullable=True)  # telegram_id преподавателя
+    admin_id = Column(BigInteger, nullable=True)  # telegram_id администратора
+    payment_id = Column(Integer, ForeignKey("pending_payments.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,52 @@
+import time
+from bisect import bisect_left
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Границы корзин гистограммы ожидания соединения, секунды
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class PoolStats:
+    """Счётчики выдачи соединений из пула: сколько раз, сколько ждали, сколько раз не дождались."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_sum = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)  # последняя — +Inf
+
+    def observe_wait(self, seconds: float):
+        self.checkouts += 1
+        self.wait_sum += seconds
+        self.wait_buckets[bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+    def snapshot(self, pool) -> dict:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_sum": self.wait_sum,
+            "wait_buckets": list(zip((*WAIT_BUCKETS, float("inf")), self.wait_buckets)),
+        }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, который замеряет время получения соединения (ожидание + pre-ping)."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.observe_wait(time.perf_counter() - start)
@@ -0,0 +1,112 @@
+import asyncio
+import multiprocessing
+import sys
+import types
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Any, Hashable, List
+
+from PIL import Image, ImageDraw, ImageFont
+
+RENDER_WORKERS = 2
+PADDING = 10
+CELL_GAP = 16
+
+# Шрифт загружается один раз в каждом процессе-воркере
+_font = None
+_executor: ProcessPoolExecutor | None = None
+
+
+def _init_worker(font_path: str | None):
+    global _font
+    _font = ImageFont.truetype(font_path, size=14) if font_path else ImageFont.load_default()
+
+
+def _render_png(rows: List[List[str]]) -> bytes:
+    """Рисует таблицу и возвращает PNG. Выполняется в процессе-воркере."""
+    ascent, descent = _font.getmetrics()
+    row_height = ascent + descent + 6
+    col_widths = [
+        int(max(_font.getlength(row[i]) for row in rows)) + CELL_GAP
+        for i in range(len(rows[0]))
+    ]
+
+    img_width = sum(col_widths) + PADDING * 2
+    img_height = row_height * len(rows) + PADDING * 2
+
+    image = Image.new("RGB", (img_width, img_height), "white")
+    draw = ImageDraw.Draw(image)
+
+    y = PADDING
+    for row in rows:
+        x = PADDING
+        for i, cell in enumerate(row):
+            draw.text((x, y), cell, fill="black", font=_font)
+            x += col_widths[i]
+        y += row_height
+
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@contextmanager
+def _without_main_module():
+    """
+    spawn запускает в каждом новом воркере заново главный скрипт (bot.py как __mp_main__),
+    а с ним conf, движок БД и все хендлеры. Пока стартуют воркеры, подменяем __main__
+    пустым модулем: воркер импортирует только этот модуль и Pillow.
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def _get_executor(font_path: str | None) -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: в работающем боте уже есть потоки (loguru, to_thread) и открытые сокеты asyncpg,
+        # а fork процесса с потоками может зависнуть
+        _executor = ProcessPoolExecutor(
+            max_workers=RENDER_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(font_path,)
+        )
+    return _executor
+
+
+async def render_table(rows: List[List[str]], font_path: str | None) -> bytes:
+    loop = asyncio.get_running_loop()
+    # воркеры spawn-пула создаются по требованию прямо в submit, то есть внутри этого вызова
+    with _without_main_module():
+        future = loop.run_in_executor(_get_executor(font_path), _render_png, rows)
+    return await future
+
+
+class PreviewCache:
+    """Небольшой LRU-кэш готовых превью. В ключ входит версия таблицы, поэтому старые записи просто вытесняются."""
+
+    def __init__(self, max_size: int = 32):
+        self.max_size = max_size
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+
+    def put(self, key: Hashable, item: Any):
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+preview_cache = PreviewCache()
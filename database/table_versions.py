@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Версия каждой таблицы в рамках процесса: растёт после каждого коммита, который её менял.
+# Используется как ключ кэшей, чтобы не сбрасывать их вручную.
+_versions: defaultdict[str, int] = defaultdict(int)
+
+
+def table_version(table_name: str) -> int:
+    return _versions[table_name]
+
+
+def bump_table_version(*table_names: str):
+    for name in table_names:
+        _versions[name] += 1
+
+
+def _changed_tables(session: Session) -> set:
+    return session.info.setdefault("changed_tables", set())
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _changed_tables(orm_execute_state.session).add(orm_execute_state.statement.table.name)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__table__", None)
+        if table is not None:
+            _changed_tables(session).add(table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session):
+    bump_table_version(*session.info.pop("changed_tables", ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_on_rollback(session):
+    session.info.pop("changed_tables", None)
@@ -1,14 +1,29 @@
+import asyncio
+import secrets
+import shlex
+import tempfile
+from pathlib import Path
+
 from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
-from aiogram.types import Message, FSInputFile, ReplyKeyboardRemove, CallbackQuery
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import Message, BufferedInputFile, FSInputFile, ReplyKeyboardRemove, CallbackQuery
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, \
+    InputMediaPhoto
+from aiogram.filters.callback_data import CallbackData
 
-from database.db_scripts import ROLE_MODEL_MAP_RU, ROLE_MODEL_MAP_ENG, add_user, delete_user, get_model_fields, generate_table_image
+from database.db_scripts import ROLE_MODEL_MAP_RU, ROLE_MODEL_MAP_ENG, add_user, delete_user, get_model_fields, generate_table_image, \
+    get_lesson_history
 from handlers.services import CreateUserStates, parse_auto_type
-from conf import logger
+from conf import logger, engine
+from database.pool import pool_stats, WAIT_BUCKETS
+from database.importer import import_users
+from database.exporter import EXPORT_MODEL_MAP, export_table_csv
+from handlers.filters import IsAdminFilter
 from database.models import Student
 
-dev_router = Router()
+dev_router = Router(name="admin_commands")
+
+DB_PAGE_SIZE = 30
 
 
 @dev_router.message(F.text.startswith("/delete_user"))
@@ -87,7 +102,7 @@ async def enter_user_data(message: Message, state: FSMContext):
         instance = model_cls(**parsed_data)
 
         # Сохраняем в БД
-        success, msg = await add_user(instance)
+        success, msg = await add_user(instance, admin_id=message.from_user.id)
 
         if success:
             await message.answer(f"✅ Пользователь роли '{role}' успешно добавлен.")
@@ -104,15 +119,229 @@ async def enter_user_data(message: Message, state: FSMContext):
 
 
 
+class DbPageCallback(CallbackData, prefix="dbpage"):
+    model: str
+    direction: str  # next | prev
+    cursor: int
+    token: str  # ключ параметров этого превью в db_browse
+
+
+# Сколько последних /show_db помнить: у каждого превью свои колонки и фильтры
+DB_BROWSE_KEEP = 10
+
+
+SHOW_DB_USAGE = (
+    "Используй формат: /show_db_<Model> [cols=name,telegram_id] [name=Иванов] [tg=<telegram_id>]\n"
+    f"Модели: {', '.join(ROLE_MODEL_MAP_ENG)}"
+)
+
+
+def parse_show_db(text: str) -> dict:
+    command, *args = shlex.split(text)
+    params = {"model": command.removeprefix("/show_db_").split("@")[0], "columns": None, "name": None,
+              "telegram_id": None}
+    for arg in args:
+        key, _, value = arg.partition("=")
+        if key == "cols":
+            params["columns"] = [c.strip() for c in value.split(",") if c.strip()]
+        elif key == "name":
+            params["name"] = value
+        elif key in ("tg", "telegram_id"):
+            params["telegram_id"] = int(value)
+        else:
+            raise ValueError(f"Неизвестный параметр {key}")
+    return params
+
+
+def db_page_kb(model_name: str, page, token: str) -> InlineKeyboardMarkup | None:
+    buttons = []
+    if page.has_prev:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=DbPageCallback(model=model_name, direction="prev", cursor=page.first_id, token=token).pack()
+        ))
+    if page.has_next:
+        buttons.append(InlineKeyboardButton(
+            text="Вперёд ➡️",
+            callback_data=DbPageCallback(model=model_name, direction="next", cursor=page.last_id, token=token).pack()
+        ))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
 @dev_router.message(F.text.startswith("/show_db"))
-async def send_students_image(message: Message):
-    model_name = message.text.split('_')[2]
-    model = ROLE_MODEL_MAP_ENG[model_name]
-    filename = await generate_table_image(model, limit=30)
-    if filename:
-        await message.answer_photo(FSInputFile(filename))
-    else:
-        await message.answer("Нет данных в таблице.")
+async def send_students_image(message: Message, state: FSMContext):
+    try:
+        params = parse_show_db(message.text)
+        model = ROLE_MODEL_MAP_ENG[params["model"]]
+    except (ValueError, KeyError):
+        return await message.answer(f"❌ {SHOW_DB_USAGE}")
 
+    try:
+        page = await generate_table_image(
+            model, limit=DB_PAGE_SIZE, columns=params["columns"], name=params["name"],
+            telegram_id=params["telegram_id"]
+        )
+    except ValueError as e:
+        return await message.answer(f"❌ {e}")
+
+    if not page:
+        return await message.answer("Нет данных в таблице.")
+
+    # колонки и фильтры не влезают в callback_data: храним их в состоянии под коротким токеном,
+    # который едет в кнопках именно этого превью
+    token = secrets.token_urlsafe(6)
+    browse = (await state.get_data()).get("db_browse") or {}
+    browse[token] = params
+    await state.update_data(db_browse=dict(list(browse.items())[-DB_BROWSE_KEEP:]))
+    await message.answer_photo(
+        BufferedInputFile(page.image, filename=f"{model.__tablename__}.png"),
+        reply_markup=db_page_kb(params["model"], page, token)
+    )
 
 
+@dev_router.callback_query(DbPageCallback.filter())
+async def switch_db_page(callback: CallbackQuery, callback_data: DbPageCallback, state: FSMContext):
+    model = ROLE_MODEL_MAP_ENG.get(callback_data.model)
+    if model is None:
+        return await callback.answer("Неизвестная таблица")
+
+    params = ((await state.get_data()).get("db_browse") or {}).get(callback_data.token)
+    if params is None or params.get("model") != callback_data.model:
+        # без сохранённых фильтров показали бы не те строки — лучше попросить открыть заново
+        return await callback.answer("Превью устарело, запусти /show_db ещё раз", show_alert=True)
+
+    cursor = {"after_id" if callback_data.direction == "next" else "before_id": callback_data.cursor}
+    page = await generate_table_image(
+        model, limit=DB_PAGE_SIZE, columns=params["columns"], name=params["name"],
+        telegram_id=params["telegram_id"], **cursor
+    )
+    if not page:
+        return await callback.answer("Больше строк нет")
+
+    await callback.message.edit_media(
+        InputMediaPhoto(media=BufferedInputFile(page.image, filename=f"{model.__tablename__}.png")),
+        reply_markup=db_page_kb(callback_data.model, page, callback_data.token)
+    )
+    await callback.answer()
+
+
+@dev_router.message(F.text == "/pool_stats", IsAdminFilter())
+async def send_pool_stats(message: Message):
+    stats = pool_stats.snapshot(engine.pool)
+    avg_wait = stats["wait_sum"] / stats["checkouts"] * 1000 if stats["checkouts"] else 0
+    histogram = "\n".join(
+        f"  ≤ {bound * 1000:g} мс: {count}" if bound != float("inf") else f"  > {WAIT_BUCKETS[-1] * 1000:g} мс: {count}"
+        for bound, count in stats["wait_buckets"] if count
+    )
+    await message.answer(
+        f"🔌 Пул соединений\n"
+        f"Размер: {stats['size']}, занято: {stats['checked_out']}, свободно: {stats['checked_in']}, "
+        f"overflow: {stats['overflow']}\n"
+        f"Выдач: {stats['checkouts']}, таймаутов: {stats['timeouts']}, среднее ожидание: {avg_wait:.1f} мс\n"
+        f"Ожидание:\n{histogram or '  нет данных'}"
+    )
+
+
+HISTORY_USAGE = "Используй формат: /history <telegram_id ученика> [до события #id]"
+HISTORY_PAGE_SIZE = 20
+
+
+def format_lesson_event(event) -> str:
+    sign = "+" if event.delta > 0 else ""
+    who = f"преп. {event.tutor_id}" if event.tutor_id else f"админ {event.admin_id}" if event.admin_id else "—"
+    when = event.created_at.strftime("%d.%m.%Y %H:%M") if event.created_at else ""
+    return f"#{event.id} {when} {event.kind} {sign}{event.delta} → {event.balance_after} ({who})"
+
+
+@dev_router.message(F.text.startswith("/history"), IsAdminFilter())
+async def lesson_history(message: Message):
+    parts = message.text.split()
+    try:
+        student_tg = int(parts[1])
+        before_id = int(parts[2]) if len(parts) > 2 else None
+    except (IndexError, ValueError):
+        return await message.answer(f"❌ {HISTORY_USAGE}")
+
+    events = await get_lesson_history(student_tg, limit=HISTORY_PAGE_SIZE, before_id=before_id)
+    if not events:
+        return await message.answer("📭 Событий нет")
+
+    text = f"📒 Занятия ученика {student_tg}:\n" + "\n".join(format_lesson_event(e) for e in events)
+    if len(events) == HISTORY_PAGE_SIZE:
+        text += f"\n\nРаньше: /history {student_tg} {events[-1].id}"
+    await message.answer(text)
+
+
+IMPORT_USAGE = (
+    "Пришли CSV или XLSX документом с подписью /import.\n"
+    "Колонки: kind (student, parent, tutor, link), telegram_id, name, payed_lessons, "
+    "parent_telegram_id, tutor_telegram_id"
+)
+# Ошибки до стольких строк показываем прямо в сообщении, больше — файлом
+IMPORT_INLINE_ERRORS = 10
+
+
+@dev_router.message(F.document, F.caption.startswith("/import"), IsAdminFilter())
+async def import_users_file(message: Message):
+    suffix = Path(message.document.file_name or "").suffix.lower()
+    if suffix not in (".csv", ".xlsx"):
+        return await message.answer(f"❌ {IMPORT_USAGE}")
+
+    await message.answer("⏳ Импортирую…")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / f"import{suffix}"
+        await message.bot.download(message.document, destination=path)
+        try:
+            report = await import_users(path)
+        except ValueError as e:
+            return await message.answer(f"❌ {e}")
+        except Exception as e:
+            logger.exception("Ошибка при импорте пользователей")
+            return await message.answer(f"❌ Импорт прерван: {e}\nУже записанные пачки сохранены.")
+
+    text = report.summary()
+    if 0 < len(report.errors) <= IMPORT_INLINE_ERRORS:
+        text += "\n" + "\n".join(f"  строка {line}: {error}" for line, error in report.errors)
+    await message.answer(text)
+    if len(report.errors) > IMPORT_INLINE_ERRORS:
+        await message.answer_document(BufferedInputFile(report.errors_csv(), filename="import_errors.csv"))
+
+
+@dev_router.message(F.text.startswith("/import"), IsAdminFilter())
+async def import_usage(message: Message):
+    await message.answer(IMPORT_USAGE)
+
+
+EXPORT_USAGE = f"Используй формат: /export_<Model>\nМодели: {', '.join(EXPORT_MODEL_MAP)}"
+# Каждая выгрузка держит соединение из пула всё время чтения, поэтому одновременно — не больше двух
+_export_slots = asyncio.Semaphore(2)
+_export_tasks: set[asyncio.Task] = set()
+
+
+async def run_export(message: Message, model_name: str):
+    model = EXPORT_MODEL_MAP[model_name]
+    async with _export_slots:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / f"{model.__tablename__}.csv.gz"
+            try:
+                rows = await export_table_csv(model, path)
+                await message.answer_document(
+                    FSInputFile(path, filename=path.name),
+                    caption=f"📤 {model_name}: {rows} строк"
+                )
+            except Exception as e:
+                logger.exception(f"Ошибка при выгрузке {model_name}")
+                await message.answer(f"❌ Не удалось выгрузить {model_name}: {e}")
+
+
+@dev_router.message(F.text.startswith("/export"), IsAdminFilter())
+async def export_model(message: Message):
+    model_name = message.text.split()[0].removeprefix("/export_").split("@")[0]
+    if model_name not in EXPORT_MODEL_MAP:
+        return await message.answer(f"❌ {EXPORT_USAGE}")
+
+    await message.answer(f"⏳ Выгружаю {model_name}, пришлю файлом, когда будет готово.")
+    # выгрузка идёт в фоне: хендлер сразу возвращается и не держит апдейты этого админа
+    task = asyncio.create_task(run_export(message, model_name))
+    _export_tasks.add(task)
+    task.add_done_callback(_export_tasks.discard)
@@ -1,18 +1,24 @@
+import asyncio
+from datetime import datetime
+
 from aiogram import Router, F
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, InlineKeyboardMarkup, InputFile, FSInputFile
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.filters.callback_data import CallbackData
+from aiogram.exceptions import TelegramBadRequest, TelegramAPIError
 
 from handlers.filters import IsAdminFilter
-from database.db_scripts import get_unregistered_users, get_model_fields, ROLE_MODEL_MAP_RU, add_user, delete_user, \
-    get_unchecked_payments, approve_payment, get_pending_payment_by_id, mark_payment_as_checked, ROLE_MODEL_MAP_ENG
+from database.db_scripts import get_model_fields, ROLE_MODEL_MAP_RU, add_user, delete_user, \
+    get_registration_page, get_registration_entry, promote_registration, approve_payment, decline_payment, \
+    ROLE_MODEL_MAP_ENG, set_payment_file_id, get_next_pending_payment, mark_checked_and_get_next
 from handlers.services import CreateUserStates, AssignRoleState
 from conf import logger
 from handlers.services import parse_auto_type
 
 
-admin_router = Router()
+admin_router = Router(name="admin_panel")
 admin_router.message.filter(IsAdminFilter())
 
 
@@ -28,40 +34,75 @@ def admin_kb() -> ReplyKeyboardMarkup:
     )
 
 
+REGISTRATION_PAGE_SIZE = 10
+
+
+class RegistrationCallback(CallbackData, prefix="reg"):
+    stack_id: int
+
+
+class RegistrationPageCallback(CallbackData, prefix="regpage"):
+    direction: str  # next | prev
+    cursor: int
+
+
+def registration_kb(page) -> InlineKeyboardMarkup:
+    kb_builder = InlineKeyboardBuilder()
+    for user in page.users:
+        kb_builder.button(
+            text=f"{user.name} (ID: {user.telegram_id})",
+            callback_data=RegistrationCallback(stack_id=user.id)
+        )
+    kb_builder.adjust(1)
+
+    nav = []
+    if page.has_prev:
+        nav.append(InlineKeyboardButton(
+            text="⬅️ Назад",
+            callback_data=RegistrationPageCallback(direction="prev", cursor=page.users[0].id).pack()
+        ))
+    if page.has_next:
+        nav.append(InlineKeyboardButton(
+            text="Вперёд ➡️",
+            callback_data=RegistrationPageCallback(direction="next", cursor=page.users[-1].id).pack()
+        ))
+    if nav:
+        kb_builder.row(*nav)
+    return kb_builder.as_markup()
+
+
 @admin_router.message(F.text == "➕ Добавить пользователя")
 async def start_assign_role(message: Message, state: FSMContext):
-    users = await get_unregistered_users()
-    if not users:
+    page = await get_registration_page(REGISTRATION_PAGE_SIZE)
+    if not page:
         await message.answer("Нет новых пользователей.")
         return
 
-    kb_builder = InlineKeyboardBuilder()
-    for user in users:
-        kb_builder.add(
-            InlineKeyboardButton(
-                text=f"{user.name} (ID: {user.telegram_id})",
-                callback_data=f"select_user:{user.telegram_id}"
-            )
-        )
-
     await state.set_state(AssignRoleState.choosing_user)
     await message.answer("Выбери пользователя для назначения роли:",
-                         reply_markup=kb_builder.as_markup())
+                         reply_markup=registration_kb(page))
 
-# --- Шаг 2: выбор пользователя, сохранение в state ---
-@admin_router.callback_query(AssignRoleState.choosing_user, F.data.startswith("select_user:"))
-async def process_user_selected(callback: CallbackQuery, state: FSMContext):
-    telegram_id = int(callback.data.split(":")[1])
-    users = await get_unregistered_users()
 
-    # Находим юзера по telegram_id из уже загруженных
-    user = next((u for u in users if u.telegram_id == telegram_id), None)
+@admin_router.callback_query(AssignRoleState.choosing_user, RegistrationPageCallback.filter())
+async def switch_registration_page(callback: CallbackQuery, callback_data: RegistrationPageCallback):
+    cursor = {"after_id" if callback_data.direction == "next" else "before_id": callback_data.cursor}
+    page = await get_registration_page(REGISTRATION_PAGE_SIZE, **cursor)
+    if not page:
+        return await callback.answer("Больше заявок нет")
+
+    await callback.message.edit_reply_markup(reply_markup=registration_kb(page))
+    await callback.answer()
+
+# --- Шаг 2: выбор пользователя, сохранение в state ---
+@admin_router.callback_query(AssignRoleState.choosing_user, RegistrationCallback.filter())
+async def process_user_selected(callback: CallbackQuery, callback_data: RegistrationCallback, state: FSMContext):
+    user = await get_registration_entry(callback_data.stack_id)
     if not user:
         await callback.message.answer("❌ Пользователь не найден.")
         await callback.answer()
         return
 
-    await state.update_data(telegram_id=telegram_id, name=user.name)
+    await state.update_data(stack_id=user.id, telegram_id=user.telegram_id, name=user.name)
     await state.set_state(AssignRoleState.choosing_role)
 
     kb_builder = InlineKeyboardBuilder()
@@ -79,7 +120,7 @@ async def process_user_selected(callback: CallbackQuery, state: FSMContext):
     )
     await callback.answer()
 
-# --- Шаг 3: выбор роли, создание юзера ---
+# --- Шаг 3: выбор роли, перенос из очереди в таблицу роли ---
 @admin_router.callback_query(AssignRoleState.choosing_role, F.data.startswith("select_role:"))
 async def process_role_selected(callback: CallbackQuery, state: FSMContext):
     role = callback.data.split(":")[1]
@@ -96,34 +137,20 @@ async def process_role_selected(callback: CallbackQuery, state: FSMContext):
         await callback.answer()
         return
 
-    try:
-        instance = model_class(telegram_id=telegram_id, name=name)
-        print(f"[INFO] Создан экземпляр {model_class.__name__} для {telegram_id} ({name})")
-    except Exception as e:
-        print(f"[ERROR] Не удалось создать экземпляр {model_class.__name__}: {e}")
-        await callback.message.answer("❌ Ошибка при создании пользователя.")
-        await callback.answer()
-        return
-
-    success, message = await add_user(instance)
+    success, message = await promote_registration(data["stack_id"], model_class)
 
     if success:
         print(f"[OK] Роль '{role}' назначена пользователю {telegram_id}")
         await callback.message.edit_text(f"✅ Пользователю {name} назначена роль '{role}'.")
     else:
         print(f"[FAIL] Не удалось добавить пользователя {telegram_id}: {message}")
-        await callback.message.answer("❌ Не удалось назначить роль.")
+        await callback.message.answer(f"❌ Не удалось назначить роль: {message}")
 
-    await callback.answer()
 
+    await callback.answer()
 
-async def send_current_payment(msg_or_cb, payment_id: int):
-    payment = await get_pending_payment_by_id(payment_id)
-    if not payment:
-        await msg_or_cb.answer("❌ Платёж не найден.")
-        return
 
-    await mark_payment_as_checked(payment_id)
+async def send_current_payment(msg_or_cb, payment):
     text = (
         f"🧾 Родитель ID: {payment.parent_id}\n"
         f"👦 Родитель: {payment.parent_name}\n"
@@ -143,48 +170,94 @@ async def send_current_payment(msg_or_cb, payment_id: int):
         ]
     ])
 
-    photo = FSInputFile(path=payment.file_path)
+    # Telegram уже хранит это фото — отправляем по file_id, без повторной загрузки с диска
+    if payment.file_id:
+        try:
+            await msg_or_cb.answer_photo(photo=payment.file_id, caption=text, reply_markup=kb)
+            return
+        except TelegramBadRequest as e:
+            logger.warning(f"file_id платежа {payment.id} не подошёл, загружаем с диска: {e}")
 
-    await msg_or_cb.answer_photo(
-        photo=photo,
+    sent = await msg_or_cb.answer_photo(
+        photo=FSInputFile(path=payment.file_path),
         caption=text,
         reply_markup=kb
     )
+    await set_payment_file_id(payment.id, sent.photo[-1].file_id)
+
+
+# Пока админ смотрит заявку, следующая за ней загружается в фоне (ключ — telegram_id админа).
+# В состоянии хранится только курсор (created_at, id) текущей заявки.
+_prefetched_payments: dict[int, asyncio.Task] = {}
+_background_tasks: set[asyncio.Task] = set()
 
 
+def _prefetch_next_payment(admin_id: int, payment):
+    task = asyncio.create_task(mark_checked_and_get_next(payment.id, payment.created_at))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    _prefetched_payments[admin_id] = task
+
+
+async def show_payment(message: Message, state: FSMContext, admin_id: int, payment):
+    await state.update_data(review_cursor={"created_at": payment.created_at.isoformat(), "id": payment.id})
+    await send_current_payment(message, payment)
+    _prefetch_next_payment(admin_id, payment)
+
+
+async def get_next_payment(admin_id: int, state: FSMContext):
+    task = _prefetched_payments.pop(admin_id, None)
+    if task is not None:
+        try:
+            return await task
+        except Exception:
+            logger.exception("Не удалось предзагрузить следующую заявку")
+
+    cursor = (await state.get_data()).get("review_cursor")
+    if cursor is None:
+        return await get_next_pending_payment()
+    return await mark_checked_and_get_next(cursor["id"], datetime.fromisoformat(cursor["created_at"]))
+
+
+async def start_review(message: Message, state: FSMContext, admin_id: int):
+    _prefetched_payments.pop(admin_id, None)
+    payment = await get_next_pending_payment()
+    if not payment:
+        await message.answer("Нет неподтверждённых оплат.")
+        return
+
+    await show_payment(message, state, admin_id, payment)
+
 
 @admin_router.message(F.text == "➕ Проверить оплаты")
 async def start_review_payments(msg: Message, state: FSMContext):
-    payments = await get_unchecked_payments()
-    if not payments:
-        await msg.answer("Нет неподтверждённых оплат.")
-        return
+    await start_review(msg, state, msg.from_user.id)
 
-    await state.update_data(pending_payments=[p.id for p in payments], current_index=0)
-    await send_current_payment(msg, payments[0].id)
+
+# Кнопка из уведомления о новой оплате
+@admin_router.callback_query(F.data == "review_payments")
+async def start_review_from_notification(callback: CallbackQuery, state: FSMContext):
+    await start_review(callback.message, state, callback.from_user.id)
+    await callback.answer()
 
 
 @admin_router.callback_query(F.data == "next_payment")
 async def next_payment(callback: CallbackQuery, state: FSMContext):
-    data = await state.get_data()
-    payments = data.get("pending_payments", [])
-    index = data.get("current_index", 0) + 1
+    payment = await get_next_payment(callback.from_user.id, state)
 
-    if index >= len(payments):
+    if payment is None:
         await callback.message.answer("Больше нет заявок.")
         await state.clear()
         await callback.answer()
         return
 
-    await state.update_data(current_index=index)
-    next_payment_id = payments[index]
-
-    await send_current_payment(callback.message, next_payment_id)
+    await show_payment(callback.message, state, callback.from_user.id, payment)
     await callback.answer()
 
 
 @admin_router.callback_query(F.data == "stop_review")
 async def stop_review(callback: CallbackQuery, state: FSMContext):
+    _prefetched_payments.pop(callback.from_user.id, None)
     await state.clear()
     await callback.message.answer("Просмотр заявок завершён.")
     await callback.answer()
@@ -198,31 +271,51 @@ async def approve_payment_handler(callback: CallbackQuery, state: FSMContext):
 
     success, student_name, approver_name = await approve_payment(payment_id, approver_id, approver_name)
     if not success:
-        await callback.message.answer("❌ Не удалось подтвердить оплату. Возможно, она уже удалена.")
+        await callback.message.answer("❌ Не удалось подтвердить оплату. Возможно, она уже обработана или удалена.")
         await callback.answer()
         return
 
     # Переходим к следующему платежу
-    data = await state.get_data()
-    payments = data.get("pending_payments", [])
-    index = data.get("current_index", 0)
-
-    # Удаляем текущий payment из списка (по id)
-    updated_payments = [p for p in payments if p != payment_id]
+    payment = await get_next_payment(callback.from_user.id, state)
 
-    if index >= len(updated_payments):
+    if payment is None:
         await state.clear()
         await callback.message.answer("✅ Оплата подтверждена.\nБольше нет заявок.")
         await callback.answer()
         return
 
-    await state.update_data(pending_payments=updated_payments)
-    next_payment_id = updated_payments[index if index < len(updated_payments) else 0]
-
     await callback.message.answer("✅ Оплата подтверждена.")
-    await send_current_payment(callback.message, next_payment_id)
+    await show_payment(callback.message, state, callback.from_user.id, payment)
     await callback.answer()
 
 
+@admin_router.callback_query(F.data.startswith("decline_"))
+async def decline_payment_handler(callback: CallbackQuery, state: FSMContext):
+    payment_id = int(callback.data.split("_")[1])
 
+    payment = await decline_payment(payment_id, callback.from_user.id, callback.from_user.full_name)
+    if payment is None:
+        await callback.message.answer("❌ Не удалось отклонить оплату. Возможно, она уже обработана.")
+        await callback.answer()
+        return
 
+    try:
+        await callback.bot.send_message(
+            payment.parent_id,
+            f"❌ Оплата {payment.lessons} занятий для ученика {payment.student_name} не подтверждена. "
+            f"Если это ошибка, пришлите скриншот ещё раз."
+        )
+    except TelegramAPIError as e:
+        logger.warning(f"Не удалось уведомить родителя {payment.parent_id} об отклонении платежа {payment_id}: {e}")
+
+    payment = await get_next_payment(callback.from_user.id, state)
+
+    if payment is None:
+        await state.clear()
+        await callback.message.answer("❌ Оплата отклонена.\nБольше нет заявок.")
+        await callback.answer()
+        return
+
+    await callback.message.answer("❌ Оплата отклонена.")
+    await show_payment(callback.message, state, callback.from_user.id, payment)
+    await callback.answer()
@@ -8,17 +8,20 @@ from handlers.admin_panel import admin_kb
 from handlers.tutor_panel import tutor_kb
 from handlers.student_panel import student_kb
 from handlers.parent_panel import parent_kb
-from handlers.services import get_role
+from handlers.services import get_role, UserRole
 from database.db_scripts import add_stack
 from handlers.services import RegistrationState
 
 
-auth = Router()
+auth = Router(name="auth")
 
 
 @auth.message(Command("start"))
-async def start_handler(message: Message, state: FSMContext):
-    role, user, is_admin = await get_role(message)
+async def start_handler(message: Message, state: FSMContext, user_role: UserRole | None = None):
+    if user_role is None:
+        role, user, is_admin = await get_role(message)
+    else:
+        role, user, is_admin = user_role.role, user_role, user_role.is_admin
 
     if role == 'admin':
         await message.answer(text=f"✅ Привет, {user.name}! Ты админ.",
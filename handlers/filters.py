@@ -1,31 +1,34 @@
 from aiogram.types import Message
 from aiogram.filters import BaseFilter
 
-from handlers.services import get_role
+from handlers.services import UserRole, resolve_role
 # from database.models import User
 
 
+async def _user_role(message: Message, user_role: UserRole | None) -> UserRole:
+    # Роль кладёт RoleMiddleware; запрос в БД — только если мидлварь не подключена
+    if user_role is None:
+        user_role = await resolve_role(message.from_user.id)
+    return user_role
+
+
 class IsAdminFilter(BaseFilter):
-    async def __call__(self, message: Message):
-        role, _, is_admin = await get_role(message)
-        return is_admin
+    async def __call__(self, message: Message, user_role: UserRole | None = None):
+        return (await _user_role(message, user_role)).is_admin
 
 
 class IsTutorFilter(BaseFilter):
-    async def __call__(self, message: Message):
-        role, _, is_admin = await get_role(message)
-        return role == 'tutor'
+    async def __call__(self, message: Message, user_role: UserRole | None = None):
+        return (await _user_role(message, user_role)).role == 'tutor'
 
 
 class IsStudentFilter(BaseFilter):
-    async def __call__(self, message: Message):
-        role, _, is_admin = await get_role(message)
-        return role == 'student'
+    async def __call__(self, message: Message, user_role: UserRole | None = None):
+        return (await _user_role(message, user_role)).role == 'student'
 
 
 class IsParentFilter(BaseFilter):
-    async def __call__(self, message: Message):
-        role, _, is_admin = await get_role(message)
-        return role == 'parent'
+    async def __call__(self, message: Message, user_role: UserRole | None = None):
+        return (await _user_role(message, user_role)).role == 'parent'
 
 
@@ -0,0 +1,101 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from database.instrumentation import start_update, finish_update, set_handler
+from handlers.services import resolve_role
+from metrics import updates_total, handler_latency, handler_exceptions
+
+
+class RoleMiddleware(BaseMiddleware):
+    """
+    Определяет роль пользователя один раз на апдейт и кладёт её в data['user_role'].
+    Фильтры и хендлеры читают её оттуда вместо повторных запросов в БД.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is not None and 'user_role' not in data:
+            data['user_role'] = await resolve_role(user.id)
+        return await handler(event, data)
+
+
+class SQLStatsMiddleware(BaseMiddleware):
+    """
+    Внешняя мидлварь апдейта: собирает SQL-запросы, сделанные за время его обработки,
+    и в конце проверяет бюджет запросов и повторы (N+1).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        token = start_update(f"update:{getattr(event, 'event_type', type(event).__name__)}")
+        try:
+            return await handler(event, data)
+        finally:
+            finish_update(token)
+
+
+class HandlerContextMiddleware(BaseMiddleware):
+    """Внутренняя мидлварь: помечает, какой хендлер сейчас выполняется."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        set_handler(handler_name(data))
+        return await handler(event, data)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешняя мидлварь апдейта: считает входящие апдейты по типу."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        updates_total.inc(getattr(event, 'event_type', type(event).__name__))
+        return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренняя мидлварь: время работы и исключения хендлеров по роутеру и имени."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        router = getattr(data.get("event_router"), "name", "unknown")
+        name = handler_name(data)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            handler_exceptions.inc(router, name, type(e).__name__)
+            raise
+        finally:
+            handler_latency.observe(router, name, value=time.perf_counter() - start)
+
+
+def handler_name(data: Dict[str, Any]) -> str:
+    handler_object = data.get("handler")
+    callback = getattr(handler_object, "callback", None)
+    if callback is None:
+        return "unknown"
+    return f"{callback.__module__}.{callback.__qualname__}"
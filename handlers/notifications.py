@@ -0,0 +1,126 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from sqlalchemy import select
+
+from conf import get_db, logger, PAYMENT_DIGEST_WINDOW, LOW_BALANCE_THRESHOLD, LOW_BALANCE_CHECK_INTERVAL
+from database.db_scripts import get_low_balance_students, mark_low_balance_reminded
+from database.models import Admin, PendingPayment
+from outbound import bulk_sending
+
+
+def review_kb() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔍 Проверить оплаты", callback_data="review_payments")]
+    ])
+
+
+def payments_digest(payments: list[PendingPayment]) -> str:
+    if len(payments) == 1:
+        p = payments[0]
+        return (
+            "💳 Новая оплата на проверку\n\n"
+            f"👦 Родитель: {p.parent_name}\n"
+            f"👦 Ученик: {p.student_name}\n"
+            f"📚 Занятий: {p.lessons}"
+        )
+    lines = [f"💳 Новых оплат на проверку: {len(payments)}\n"]
+    lines += [f"• {p.parent_name} → {p.student_name}: {p.lessons} зан." for p in payments]
+    return "\n".join(lines)
+
+
+class PaymentNotifier:
+    """
+    Рассылает админам уведомления о новых оплатах.
+    Оплаты, пришедшие в течение window секунд, собираются в одно сообщение-дайджест.
+    """
+
+    def __init__(self, window: float = PAYMENT_DIGEST_WINDOW):
+        self.window = window
+        self._pending: list[PendingPayment] = []
+        self._flush_task: asyncio.Task | None = None
+
+    def add(self, bot: Bot, payment: PendingPayment):
+        self._pending.append(payment)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later(bot))
+
+    async def _flush_later(self, bot: Bot):
+        # оплаты, пришедшие, пока рассылался дайджест, add() отдаёт этой же задаче — уходят следующим
+        while self._pending:
+            await asyncio.sleep(self.window)
+            payments, self._pending = self._pending, []
+            try:
+                await self._send(bot, payments)
+            except Exception:
+                logger.exception(f"Не удалось разослать уведомление об оплатах {[p.id for p in payments]}")
+
+    async def _send(self, bot: Bot, payments: list[PendingPayment]):
+        async with get_db() as db:
+            admin_ids = (await db.execute(select(Admin.telegram_id))).scalars().all()
+        if not admin_ids:
+            logger.warning("Некому отправить уведомление об оплате: в таблице admins пусто")
+            return
+
+        text = payments_digest(payments)
+        kb = review_kb()
+
+        async def send(chat_id: int):
+            try:
+                await bot.send_message(chat_id, text, reply_markup=kb)
+            except TelegramAPIError as e:
+                logger.warning(f"Админ {chat_id} не получил уведомление об оплате: {e}")
+
+        # темп задаёт очередь исходящих сообщений, интерактивные ответы идут вперёд
+        with bulk_sending():
+            await asyncio.gather(*(send(chat_id) for chat_id in admin_ids))
+        logger.info(f"Уведомление о {len(payments)} оплатах отправлено {len(admin_ids)} админам")
+
+
+payment_notifier = PaymentNotifier()
+
+
+def notify_new_payment(bot: Bot, payment: PendingPayment):
+    payment_notifier.add(bot, payment)
+
+
+def low_balance_text(students: list) -> str:
+    lines = ["⏳ Заканчиваются оплаченные занятия:\n"]
+    lines += [f"• {s.name}: осталось {s.payed_lessons}" for s in students]
+    lines.append("\nПополнить можно кнопкой «➕ Оплата».")
+    return "\n".join(lines)
+
+
+async def send_low_balance_reminders(bot: Bot, threshold: int = LOW_BALANCE_THRESHOLD) -> int:
+    """Одно напоминание каждому родителю по всем его ученикам с балансом <= threshold. Возвращает число родителей."""
+    by_parent = await get_low_balance_students(threshold)
+    if not by_parent:
+        return 0
+
+    reminded_ids = []
+
+    async def send(parent_telegram_id: int, students: list):
+        try:
+            await bot.send_message(parent_telegram_id, low_balance_text(students))
+        except TelegramAPIError as e:
+            logger.warning(f"Родитель {parent_telegram_id} не получил напоминание о балансе: {e}")
+            return
+        reminded_ids.extend(s.id for s in students)
+
+    with bulk_sending():
+        await asyncio.gather(*(send(parent_id, students) for parent_id, students in by_parent.items()))
+    await mark_low_balance_reminded(reminded_ids, threshold)
+    logger.info(f"Напоминания о балансе: {len(by_parent)} родителей, {len(reminded_ids)} учеников")
+    return len(by_parent)
+
+
+async def low_balance_reminder_loop(bot: Bot, interval: float = LOW_BALANCE_CHECK_INTERVAL):
+    """Фоновая задача бота: раз в interval секунд рассылает напоминания о балансе."""
+    while True:
+        try:
+            await send_low_balance_reminders(bot)
+        except Exception:
+            logger.exception("Ошибка при рассылке напоминаний о балансе")
+        await asyncio.sleep(interval)
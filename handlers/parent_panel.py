@@ -11,11 +11,12 @@ from datetime import datetime
 
 from database.db_scripts import get_students_lessons_by_parent, create_pending_payment, get_parent_by_id
 from handlers.filters import IsParentFilter
+from handlers.notifications import notify_new_payment
 from handlers.services import PaymentStates
 from conf import logger
 
 
-parent_router = Router()
+parent_router = Router(name="parent_panel")
 parent_router.message.filter(IsParentFilter())
 
 
@@ -97,7 +98,7 @@ async def handle_payment_screenshot(msg: Message, state: FSMContext):
         return
 
     try:
-        await create_pending_payment(
+        payment = await create_pending_payment(
             message=msg,
             parent_id=parent_tg_id,
             parent_name=parent_name,
@@ -109,6 +110,8 @@ async def handle_payment_screenshot(msg: Message, state: FSMContext):
         await msg.answer("Произошла ошибка при сохранении оплаты.")
         raise e
 
+    # Админам — уведомление (с задержкой на сбор дайджеста), без сканирования таблицы
+    notify_new_payment(msg.bot, payment)
     await msg.answer(
         f"Спасибо! Мы проверим оплату и начислим {lesson_count} занятий ученику {student_name}."
     )
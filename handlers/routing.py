@@ -0,0 +1,45 @@
+from typing import Any, Iterable
+
+from aiogram import Router
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import TelegramObject
+
+from handlers.services import UserRole
+
+
+class RoleRouter(Router):
+    """
+    Передаёт событие сразу роутерам роли пользователя (data['user_role'] из RoleMiddleware),
+    не перебирая по очереди роутеры остальных ролей.
+    """
+
+    def __init__(self, *, admin: Router, roles: dict[str, Router], common: Iterable[Router] = (), name: str | None = None):
+        super().__init__(name=name)
+        self.admin = admin
+        self.roles = roles
+        self.common = list(common)
+
+        for router in (admin, *roles.values(), *self.common):
+            if router.parent_router is None:
+                self.include_router(router)
+
+    def routers_for(self, user_role: UserRole) -> list[Router]:
+        routers = []
+        if user_role.is_admin:
+            routers.append(self.admin)
+        role_router = self.roles.get(user_role.role)
+        if role_router is not None and role_router not in routers:
+            routers.append(role_router)
+        routers.extend(self.common)
+        return routers
+
+    async def propagate_event(self, update_type: str, event: TelegramObject, **kwargs: Any) -> Any:
+        user_role = kwargs.get('user_role')
+        if user_role is None:
+            return await super().propagate_event(update_type=update_type, event=event, **kwargs)
+
+        for router in self.routers_for(user_role):
+            response = await router.propagate_event(update_type=update_type, event=event, **kwargs)
+            if response is not UNHANDLED:
+                return response
+        return UNHANDLED
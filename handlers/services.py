@@ -1,11 +1,14 @@
-from datetime import datetime
+import hashlib
+import os
+from dataclasses import dataclass
 from functools import wraps
 from pathlib import Path
+from uuid import uuid4
 
 from loguru import logger
 from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.state import StatesGroup, State
-from sqlalchemy import select
+from sqlalchemy import select, union_all, literal, literal_column, false, Integer, String
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.filters import StateFilter
 
@@ -13,30 +16,70 @@ from conf import get_db
 from database.models import Admin, Tutor, Student, Parent
 
 
-async def get_role(message: Message):
+@dataclass(frozen=True)
+class UserRole:
+    """Роль пользователя, определённая одним запросом к БД."""
+    role: str
+    telegram_id: int
+    id: int | None = None
+    name: str | None = None
+    is_admin: bool = False
+    roles: tuple[str, ...] = ()
+
+    @property
+    def is_known(self) -> bool:
+        return self.role != 'unknown'
+
+
+# Приоритет ролей: admin > tutor > student > parent
+ROLE_PRIORITY = (
+    ('admin', Admin),
+    ('tutor', Tutor),
+    ('student', Student),
+    ('parent', Parent),
+)
+
+
+def role_query(telegram_id: int):
+    """UNION ALL по всем таблицам ролей, отсортированный по приоритету."""
+    parts = []
+    for priority, (role, model) in enumerate(ROLE_PRIORITY):
+        is_admin = model.is_admin if hasattr(model, 'is_admin') else false()
+        parts.append(
+            select(
+                literal(priority, Integer).label('priority'),
+                literal(role, String).label('role'),
+                model.id.label('id'),
+                model.name.label('name'),
+                is_admin.label('is_admin'),
+            ).where(model.telegram_id == telegram_id)
+        )
+    return union_all(*parts).order_by(literal_column('priority'))
+
+
+async def resolve_role(telegram_id: int) -> UserRole:
     async with get_db() as db:
+        rows = (await db.execute(role_query(telegram_id))).all()
 
-        result = await db.execute(select(Admin).where(Admin.telegram_id == message.from_user.id))
-        admin = result.scalars().first()
-        if admin:
-            return 'admin', admin, admin.is_admin
-
-        result = await db.execute(select(Tutor).where(Tutor.telegram_id == message.from_user.id))
-        tutor = result.scalars().first()
-        if tutor:
-            return 'tutor', tutor, tutor.is_admin
+    if not rows:
+        return UserRole(role='unknown', telegram_id=telegram_id)
 
-        result = await db.execute(select(Student).where(Student.telegram_id == message.from_user.id))
-        student = result.scalars().first()
-        if student:
-            return 'student', student, student.is_admin
+    top = rows[0]
+    return UserRole(
+        role=top.role,
+        telegram_id=telegram_id,
+        id=top.id,
+        name=top.name,
+        is_admin=bool(top.is_admin),
+        roles=tuple(row.role for row in rows),
+    )
 
-        result = await db.execute(select(Parent).where(Parent.telegram_id == message.from_user.id))
-        parent = result.scalars().first()
-        if parent:
-            return 'parent', parent, False
 
+async def get_role(message: Message):
+    user_role = await resolve_role(message.from_user.id)
+    if not user_role.is_known:
         return 'unknown', None, False
+    return user_role.role, user_role, user_role.is_admin
 
 
 class AddTutorStates(StatesGroup):
@@ -88,26 +131,39 @@ async def parse_auto_type(value: str):
     return val
 
 
-async def save_user_image(message: Message):
-    user_id = message.from_user.id
+UPLOADS_DIR = Path("uploads")
+BLOBS_DIR = UPLOADS_DIR / "blobs"
+
 
+def blob_path(file_unique_id: str) -> Path:
+    """
+    Путь к файлу в хранилище по file_unique_id от Telegram: одинаковые фото всегда
+    попадают в один и тот же файл. Раскладка по подпапкам uploads/blobs/ab/cd/<sha256>.jpg.
+    """
+    digest = hashlib.sha256(file_unique_id.encode()).hexdigest()
+    return BLOBS_DIR / digest[:2] / digest[2:4] / f"{digest}.jpg"
+
+
+async def save_user_image(message: Message):
     # 1. Получаем файл
     if not message.photo:
         return await message.answer("Пришли фото.")
     file = message.photo[-1]  # самое большое изображение
-    tg_file = await message.bot.get_file(file.file_id)
 
-    # 2. Создаём папку пользователя
-    user_dir = Path(f"uploads/{user_id}")
-    user_dir.mkdir(parents=True, exist_ok=True)
+    # 2. Такое фото уже сохранено — не скачиваем повторно
+    file_path = blob_path(file.file_unique_id)
+    if file_path.exists():
+        logger.debug(f"Фото {file.file_unique_id} уже есть в хранилище: {file_path}")
+        return file_path
 
-    # 3. Формируем имя файла
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    file_name = f"{timestamp}.jpg"
-    file_path = user_dir / file_name
-
-    # 4. Сохраняем файл
-    await message.bot.download_file(tg_file.file_path, destination=file_path)
+    # 3. Скачиваем во временный файл и атомарно переименовываем
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = file_path.with_name(f"{file_path.name}.{uuid4().hex}.tmp")
+    try:
+        await message.bot.download(file, destination=tmp_path)
+        os.replace(tmp_path, file_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
 
     return file_path
 
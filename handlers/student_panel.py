@@ -13,7 +13,7 @@ from handlers.filters import IsStudentFilter
 from conf import logger
 
 
-student_router = Router()
+student_router = Router(name="student_panel")
 student_router.message.filter(IsStudentFilter())
 
 
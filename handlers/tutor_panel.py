@@ -5,11 +5,11 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardBut
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.filters.callback_data import CallbackData
 
-from database.db_scripts import get_students_for_tutor, decrease_student_credit
+from database.db_scripts import get_roster_for_tutor, roster_version, decrease_student_credit
 from handlers.filters import IsTutorFilter
 from conf import logger
 
-tutor_router = Router()
+tutor_router = Router(name="tutor_panel")
 tutor_router.message.filter(IsTutorFilter())
 
 
@@ -31,14 +31,14 @@ def tutor_kb() -> ReplyKeyboardMarkup:
     )
 
 
-def get_keyboard(students, selected_ids):
+def get_keyboard(roster, selected_ids):
     builder = InlineKeyboardBuilder()
-    for student in students:
-        is_selected = student.telegram_id in selected_ids
+    for telegram_id, name in roster:
+        is_selected = telegram_id in selected_ids
         emoji = "✅" if is_selected else "☐"
         builder.button(
-            text=f"{emoji} {student.name}",
-            callback_data=StudentCallback(telegram_id=student.telegram_id).pack()
+            text=f"{emoji} {name}",
+            callback_data=StudentCallback(telegram_id=telegram_id).pack()
         )
     builder.button(text="Готово", callback_data="done")
     builder.adjust(1)
@@ -48,15 +48,16 @@ def get_keyboard(students, selected_ids):
 @tutor_router.message(F.text == "➕ Отметить занятия")
 async def start_check_payment(message: Message, state: FSMContext):
     tutor_id = message.from_user.id
-    students = await get_students_for_tutor(tutor_id)
+    roster = await get_roster_for_tutor(tutor_id)
 
-    if not students:
+    if not roster:
         await message.answer("У вас пока нет учеников.")
         return
 
-    await state.update_data(selected_ids=[])  # очищаем предыдущий выбор
+    # очищаем предыдущий выбор и запоминаем список учеников на время отметки
+    await state.update_data(selected_ids=[], roster=roster, roster_version=roster_version())
 
-    markup = get_keyboard(students, selected_ids=[])
+    markup = get_keyboard(roster, selected_ids=[])
     await message.answer("Выберите учеников, оплативших занятия:", reply_markup=markup)
 
 
@@ -74,9 +75,12 @@ async def toggle_student(callback: CallbackQuery, callback_data: student_cb, sta
 
     await state.update_data(selected_ids=list(selected_ids))
 
-    # перерисовать клавиатуру
-    students = await get_students_for_tutor(tutor_id) # список учеников
-    markup = get_keyboard(students, selected_ids)
+    # перерисовать клавиатуру по снимку; перечитываем только если связи менялись
+    roster = data.get("roster")
+    if roster is None or data.get("roster_version") != roster_version():
+        roster = await get_roster_for_tutor(tutor_id)
+        await state.update_data(roster=roster, roster_version=roster_version())
+    markup = get_keyboard(roster, selected_ids)
     await callback.message.edit_reply_markup(reply_markup=markup)
     await callback.answer()
 
@@ -0,0 +1,183 @@
+"""
+Метрики бота в формате Prometheus.
+
+Счётчики и гистограммы — обычные словари в памяти процесса без блокировок
+(всё выполняется в одном event loop), поэтому сбор можно не выключать в проде.
+Отдаются по HTTP: GET /metrics на METRICS_HOST:METRICS_PORT.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiohttp import web
+
+from conf import engine, logger
+from database.instrumentation import handler_totals
+from database.pool import pool_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [счётчики корзин (+Inf последняя), сумма]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, *labels, value: float):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total) in self._values.items():
+            yield from render_histogram(self.name, self.labelnames, labels, self.buckets, counts, total)
+
+
+def render_histogram(name: str, labelnames: tuple, labels: tuple, buckets: tuple, counts: list, total: float):
+    cumulative = 0
+    for bound, count in zip((*buckets, "+Inf"), counts):
+        cumulative += count
+        le = f'le="{bound}"'
+        yield f"{name}_bucket{_labels(labelnames, labels, le)} {cumulative}"
+    yield f"{name}_sum{_labels(labelnames, labels)} {total}"
+    yield f"{name}_count{_labels(labelnames, labels)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: list[Callable[[], Iterable[str]]] = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func: Callable[[], Iterable[str]]):
+        """Функция, которая при каждом скрейпе сама отдаёт строки метрик (значения из других модулей)."""
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+updates_total = registry.counter("bot_updates_total", "Входящие апдейты по типу", ("type",))
+handler_latency = registry.histogram(
+    "bot_handler_duration_seconds", "Время работы хендлера", ("router", "handler")
+)
+handler_exceptions = registry.counter(
+    "bot_handler_exceptions_total", "Исключения в хендлерах", ("router", "handler", "exception")
+)
+api_latency = registry.histogram("bot_api_request_duration_seconds", "Время запросов к Bot API", ("method",))
+api_errors = registry.counter("bot_api_errors_total", "Ошибки запросов к Bot API", ("method", "exception"))
+
+
+@registry.collector
+def _pool_metrics():
+    stats = pool_stats.snapshot(engine.pool)
+    for key in ("size", "checked_out", "checked_in", "overflow"):
+        yield f"# TYPE db_pool_{key} gauge"
+        yield f"db_pool_{key} {stats[key]}"
+    yield "# TYPE db_pool_timeouts_total counter"
+    yield f"db_pool_timeouts_total {stats['timeouts']}"
+    yield "# TYPE db_pool_wait_seconds histogram"
+    bounds = tuple(bound for bound, _ in stats["wait_buckets"][:-1])
+    counts = [count for _, count in stats["wait_buckets"]]
+    yield from render_histogram("db_pool_wait_seconds", (), (), bounds, counts, stats["wait_sum"])
+
+
+@registry.collector
+def _sql_metrics():
+    yield "# TYPE sql_queries_total counter"
+    for handler, totals in handler_totals.items():
+        yield f"sql_queries_total{_labels(('handler',), (handler,))} {totals.queries}"
+    yield "# TYPE sql_query_duration_seconds_total counter"
+    for handler, totals in handler_totals.items():
+        yield f"sql_query_duration_seconds_total{_labels(('handler',), (handler,))} {totals.duration}"
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Мидлварь сессии бота: время и ошибки каждого запроса к Bot API."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            api_errors.inc(method.__api_method__, type(e).__name__)
+            raise
+        finally:
+            api_latency.observe(method.__api_method__, value=time.perf_counter() - start)
+
+
+async def _metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
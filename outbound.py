@@ -0,0 +1,235 @@
+"""
+Очередь исходящих запросов к Bot API с учётом лимитов Telegram.
+
+Каждый запрос с chat_id ждёт токен из двух ведёр: общего на бота и своего на чат.
+Ожидающие запросы выдаются по приоритету: ответы пользователю (INTERACTIVE) раньше
+рассылок (BULK). Рассылки помечаются контекстом:
+
+    with bulk_sending():
+        for chat_id in chat_ids:
+            await bot.send_message(chat_id, text)
+
+На 429 (TelegramRetryAfter) чат замораживается на retry_after секунд, и запрос
+встаёт в очередь заново. Запросы без chat_id (answerCallbackQuery, getFile, ...)
+идут мимо очереди.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+from conf import OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_GROUP_RATE, \
+    OUTBOUND_MAX_RETRIES, logger
+from metrics import registry
+
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=INTERACTIVE)
+
+outbound_wait = registry.histogram(
+    "bot_outbound_wait_seconds", "Ожидание слота на отправку в очереди", ("priority",)
+)
+outbound_retries = registry.counter(
+    "bot_outbound_retries_total", "Повторы запросов после 429 (retry_after)", ("method",)
+)
+
+
+@contextmanager
+def bulk_sending():
+    """Запросы внутри блока (и в созданных из него задачах) уходят с низким приоритетом."""
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float, now: float | None = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        # now мог быть снят раньше, чем ведро создано: время назад не отнимает токены
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — уже есть)."""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Мидлварь сессии бота: пропускает запросы к чатам с соблюдением лимитов и приоритетов."""
+
+    # Сколько вёдер чатов держать, прежде чем выбросить простаивающие
+    MAX_IDLE_BUCKETS = 1000
+
+    def __init__(
+        self,
+        global_rate: float = OUTBOUND_GLOBAL_RATE,
+        chat_rate: float = OUTBOUND_CHAT_RATE,
+        chat_burst: int = OUTBOUND_CHAT_BURST,
+        group_rate: float = OUTBOUND_GROUP_RATE,
+        max_retries: int = OUTBOUND_MAX_RETRIES,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict[int | str, TokenBucket] = {}
+        # (приоритет, порядковый номер, chat_id, future)
+        self._queue: list[tuple[int, int, int | str, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._worker: asyncio.Task | None = None
+
+    def depth(self) -> dict[int, int]:
+        counts = dict.fromkeys(PRIORITY_NAMES, 0)
+        for priority, _, _, future in self._queue:
+            if not future.done():
+                counts[priority] += 1
+        return counts
+
+    def _chat_bucket(self, chat_id: int | str, now: float | None = None) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if now is None:
+                now = time.monotonic()
+            if len(self._chats) >= self.MAX_IDLE_BUCKETS:
+                self._chats = {key: b for key, b in self._chats.items() if not b.idle(now)}
+            # отрицательные id — группы и каналы, там лимит строже
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1, now)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, chat_id: int | str, priority: int = INTERACTIVE):
+        """Ждёт, пока можно отправить запрос в chat_id."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), chat_id, future))
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        self._wakeup.set()
+        start = time.perf_counter()
+        await future
+        outbound_wait.observe(PRIORITY_NAMES[priority], value=time.perf_counter() - start)
+
+    def _grant_next(self) -> float:
+        """Выдаёт слот первому по приоритету запросу, чей чат готов. Возвращает, сколько ждать до следующей попытки."""
+        now = time.monotonic()
+        wait = self._global.delay(now)
+        if wait > 0:
+            return wait
+
+        skipped = []
+        wait = None
+        try:
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                future = entry[3]
+                if future.done():  # отправитель отменён
+                    continue
+                bucket = self._chat_bucket(entry[2], now)
+                chat_wait = bucket.delay(now)
+                if chat_wait > 0:
+                    skipped.append(entry)
+                    wait = chat_wait if wait is None else min(wait, chat_wait)
+                    continue
+                bucket.take(now)
+                self._global.take(now)
+                future.set_result(None)
+                return 0
+        finally:
+            for entry in skipped:
+                heapq.heappush(self._queue, entry)
+        return wait
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            wait = self._grant_next()
+            if wait is None:  # в очереди остались только отменённые
+                continue
+            if wait > 0:
+                # новый запрос в свободный чат может прийти раньше, чем освободится этот
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(0)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(chat_id, priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                outbound_retries.inc(method.__api_method__)
+                logger.warning(f"429 на {method.__api_method__} в чат {chat_id}: повтор через {e.retry_after} с")
+                self._chat_bucket(chat_id).block(e.retry_after)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        for *_, future in self._queue:
+            future.cancel()
+        self._queue.clear()
+
+
+outbound_scheduler = OutboundScheduler()
+
+
+@registry.collector
+def _outbound_metrics():
+    yield "# TYPE bot_outbound_queue_depth gauge"
+    for priority, count in outbound_scheduler.depth().items():
+        yield f'bot_outbound_queue_depth{{priority="{PRIORITY_NAMES[priority]}"}} {count}'
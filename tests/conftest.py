@@ -0,0 +1,13 @@
+import os
+
+# conf собирает DATABASE_URL при импорте; без .env подставляем заглушки.
+# Тесты, которым нужна настоящая база, сами пропускаются, если она недоступна.
+for name, value in {
+    "DB_USER": "postgres",
+    "DB_PASSWORD": "postgres",
+    "DB_NAME": "postgres",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "TOKEN": "42:TEST",
+}.items():
+    os.environ.setdefault(name, value)
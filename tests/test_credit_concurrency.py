@@ -0,0 +1,109 @@
+"""
+Списания и подтверждения оплат под параллельными вызовами. Нужна настоящая PostgreSQL
+(настройки DB_* из окружения / .env); если она недоступна, тесты пропускаются.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from conf import engine, get_db
+from database.db_scripts import decrease_student_credit, approve_payment
+from database.migrations import apply_migrations
+from database.models import Admin, LessonEvent, PendingPayment, Student
+
+STUDENT_TG, TUTOR_TG, ADMIN_TG = 9_200_000_001, 9_200_000_002, 9_200_000_003
+PARALLEL_CALLS = 20
+START_BALANCE = 50
+
+
+def run_with_db(test):
+    """Запускает тест в одном event loop, а пул соединений закрывает в конце (он привязан к loop)."""
+    async def runner():
+        try:
+            async with asyncio.timeout(5):
+                async with engine.connect():
+                    pass
+        except Exception as e:
+            await engine.dispose()
+            pytest.skip(f"PostgreSQL недоступна: {e}")
+        try:
+            await apply_migrations()
+            await test()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(runner())
+
+
+async def _cleanup():
+    async with get_db() as db:
+        student_ids = select(Student.id).where(Student.telegram_id == STUDENT_TG)
+        await db.execute(delete(LessonEvent).where(LessonEvent.student_id.in_(student_ids)))
+        await db.execute(delete(PendingPayment).where(PendingPayment.parent_id == STUDENT_TG))
+        await db.execute(delete(Student).where(Student.telegram_id == STUDENT_TG))
+        await db.execute(delete(Admin).where(Admin.telegram_id == ADMIN_TG))
+        await db.commit()
+
+
+async def _seed_student(balance: int) -> int:
+    await _cleanup()
+    async with get_db() as db:
+        student = Student(telegram_id=STUDENT_TG, name="Concurrency Student", payed_lessons=balance)
+        db.add(student)
+        await db.commit()
+        return student.id
+
+
+async def _balance_and_events(student_id: int, kind: str) -> tuple[int, int]:
+    async with get_db() as db:
+        balance = (await db.execute(select(Student.payed_lessons).where(Student.id == student_id))).scalar()
+        events = (await db.execute(
+            select(func.count()).select_from(LessonEvent)
+            .where(LessonEvent.student_id == student_id, LessonEvent.kind == kind)
+        )).scalar()
+    return balance, events
+
+
+def test_parallel_debits_are_not_lost():
+    async def test():
+        student_id = await _seed_student(START_BALANCE)
+        try:
+            await asyncio.gather(*(
+                decrease_student_credit([STUDENT_TG], TUTOR_TG) for _ in range(PARALLEL_CALLS)
+            ))
+            balance, debits = await _balance_and_events(student_id, "debit")
+            assert balance == START_BALANCE - PARALLEL_CALLS
+            assert debits == PARALLEL_CALLS
+        finally:
+            await _cleanup()
+
+    run_with_db(test)
+
+
+def test_concurrent_approvals_credit_once():
+    async def test():
+        student_id = await _seed_student(0)
+        try:
+            async with get_db() as db:
+                db.add(Admin(telegram_id=ADMIN_TG, name="Concurrency Admin"))
+                payment = PendingPayment(
+                    parent_id=STUDENT_TG, parent_name="Parent", student_id=student_id,
+                    student_name="Concurrency Student", lessons=4, file_path="/dev/null"
+                )
+                db.add(payment)
+                await db.commit()
+
+            results = await asyncio.gather(
+                approve_payment(payment.id, ADMIN_TG, "Admin A"),
+                approve_payment(payment.id, ADMIN_TG, "Admin B"),
+            )
+            assert sorted(ok for ok, *_ in results) == [False, True]
+
+            balance, credits = await _balance_and_events(student_id, "credit")
+            assert balance == 4
+            assert credits == 1
+        finally:
+            await _cleanup()
+
+    run_with_db(test)
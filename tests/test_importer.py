@@ -0,0 +1,50 @@
+import csv
+import io
+
+import pytest
+from openpyxl import Workbook
+
+from database.importer import ImportReport, iter_import_rows, parse_import_row
+
+
+@pytest.mark.parametrize("value, expected", [("12", 12), ("12.0", 12), (" 7 ", 7), ("", 0)])
+def test_payed_lessons_accepts_integers(value, expected):
+    _, row = parse_import_row({"kind": "student", "telegram_id": "1", "name": "Аня", "payed_lessons": value})
+    assert row["payed_lessons"] == expected
+
+
+@pytest.mark.parametrize("value", ["1.5", "2,0", "abc", "0.999"])
+def test_payed_lessons_rejects_non_integers(value):
+    with pytest.raises(ValueError, match="payed_lessons"):
+        parse_import_row({"kind": "student", "telegram_id": "1", "name": "Аня", "payed_lessons": value})
+
+
+def test_telegram_id_from_xlsx_float():
+    kind, row = parse_import_row({"kind": "link", "telegram_id": "123.0", "tutor_telegram_id": "456"})
+    assert (kind, row) == ("link", {"telegram_id": 123, "tutor_telegram_id": 456})
+
+
+def test_errors_csv_round_trips_quotes_commas_and_newlines():
+    report = ImportReport()
+    errors = [(2, 'kind должен быть "student", получено "x"'), (3, "строка\nс переносом")]
+    for line, text in errors:
+        report.error(line, text)
+
+    data = report.errors_csv()
+    assert data.startswith("﻿".encode())
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+    assert rows == [["line", "error"], *([str(line), text] for line, text in errors)]
+
+
+def test_reads_xlsx_numbers_as_integers(tmp_path):
+    path = tmp_path / "users.xlsx"
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["Kind", "telegram_id", "name", "payed_lessons", "parent_telegram_id", "tutor_telegram_id"])
+    sheet.append(["student", 123, "Аня", 4, None, 456])
+    workbook.save(path)
+
+    kind, row = parse_import_row(next(iter_import_rows(path)))
+    assert kind == "student"
+    assert row == {"telegram_id": 123, "name": "Аня", "payed_lessons": 4,
+                   "parent_telegram_id": None, "tutor_telegram_id": 456}
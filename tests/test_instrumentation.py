@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from database import instrumentation
+from database.instrumentation import install_sql_instrumentation, start_update, finish_update
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    install_sql_instrumentation(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_failed_statement_does_not_leak_start_time(engine):
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM no_such_table"))
+        conn.execute(text("SELECT 1"))
+        assert conn.connection.info.get("query_start") == []
+
+
+def test_counts_queries_and_flags_repeats(engine, monkeypatch):
+    debug_lines = []
+    monkeypatch.setattr(instrumentation.logger, "debug", debug_lines.append)
+
+    token = start_update("update 1")
+    with engine.connect() as conn:
+        for _ in range(3):
+            conn.execute(text("SELECT 1"))
+    stats = finish_update(token)
+
+    assert stats.queries == 3
+    assert stats.repeated(threshold=3) == [("SELECT 1", 3)]
+    # по умолчанию (SQL_LOG_STATEMENTS=0) отдельные запросы в лог не пишутся
+    assert debug_lines == []
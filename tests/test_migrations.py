@@ -0,0 +1,44 @@
+"""
+Миграции — явный DDL, поэтому новая колонка в моделях без миграции молча не попадёт
+в свежую базу. Тест сверяет Base.metadata с текстом миграций; база для него не нужна.
+"""
+import re
+
+import pytest
+
+from conf import Base
+import database.models  # noqa: F401 — регистрирует таблицы в Base.metadata
+from database.migrations import MIGRATIONS
+
+DDL = "\n".join(statement for migration in MIGRATIONS for statement in migration.statements)
+
+
+def created_columns(table: str) -> set[str]:
+    match = re.search(rf"CREATE TABLE IF NOT EXISTS {table} \((.*?)\n\s*\)\s*$", DDL, re.S | re.M)
+    if match is None:
+        return set()
+    return {line.split()[0] for line in match.group(1).strip().splitlines() if line.strip()}
+
+
+def added_columns(table: str) -> set[str]:
+    return set(re.findall(rf"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS (\w+)", DDL))
+
+
+def test_versions_are_unique_and_ascending():
+    versions = [migration.version for migration in MIGRATIONS]
+    assert versions == sorted(set(versions))
+
+
+@pytest.mark.parametrize("table", sorted(Base.metadata.tables))
+def test_every_model_column_has_a_migration(table):
+    columns = created_columns(table)
+    assert columns, f"нет CREATE TABLE для {table}"
+    missing = {c.name for c in Base.metadata.tables[table].columns} - columns - added_columns(table)
+    assert not missing
+
+
+@pytest.mark.parametrize("index", sorted(
+    index.name for table in Base.metadata.tables.values() for index in table.indexes
+))
+def test_every_model_index_has_a_migration(index):
+    assert re.search(rf"CREATE INDEX IF NOT EXISTS {index}\s+ON ", DDL)
@@ -0,0 +1,50 @@
+import asyncio
+from types import SimpleNamespace
+
+from handlers.notifications import PaymentNotifier
+
+WINDOW = 0.05
+
+
+class RecordingNotifier(PaymentNotifier):
+    """Вместо рассылки запоминает id оплат в каждом дайджесте; отправка длится send_time секунд."""
+
+    def __init__(self, send_time: float = 0):
+        super().__init__(window=WINDOW)
+        self.send_time = send_time
+        self.digests = []
+        self.sending = asyncio.Event()
+
+    async def _send(self, bot, payments):
+        self.sending.set()
+        await asyncio.sleep(self.send_time)
+        self.digests.append([p.id for p in payments])
+
+
+def payment(payment_id: int):
+    return SimpleNamespace(id=payment_id)
+
+
+def test_payments_within_window_share_one_digest():
+    async def scenario():
+        notifier = RecordingNotifier()
+        for payment_id in (1, 2, 3):
+            notifier.add(None, payment(payment_id))
+        await notifier._flush_task
+        return notifier.digests
+
+    assert asyncio.run(scenario()) == [[1, 2, 3]]
+
+
+def test_payment_arriving_during_send_is_delivered():
+    async def scenario():
+        notifier = RecordingNotifier(send_time=WINDOW)
+        notifier.add(None, payment(1))
+        await notifier.sending.wait()
+        notifier.add(None, payment(2))
+        await asyncio.wait_for(notifier._flush_task, timeout=1)
+        return notifier.digests, notifier._pending
+
+    digests, pending = asyncio.run(scenario())
+    assert digests == [[1], [2]]
+    assert pending == []
@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from benchmarks.run import FakeSession
+from outbound import BULK, INTERACTIVE, OutboundScheduler, TokenBucket, bulk_sending
+
+GROUP_CHAT, USER_CHAT = -100_500, 100_500
+
+
+class RecordingSession(FakeSession):
+    """Запоминает (время, chat_id, text) каждой попытки; первые failures попыток в fail_chat — 429."""
+
+    def __init__(self, fail_chat=None, failures: int = 0, retry_after: int = 1):
+        super().__init__()
+        self.fail_chat = fail_chat
+        self.failures = failures
+        self.retry_after = retry_after
+        self.attempts = []
+
+    async def make_request(self, bot, method, timeout=None):
+        chat_id = getattr(method, "chat_id", None)
+        self.attempts.append((time.monotonic(), chat_id, getattr(method, "text", None)))
+        if chat_id == self.fail_chat and self.failures:
+            self.failures -= 1
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=self.retry_after)
+        return await super().make_request(bot, method, timeout)
+
+
+def run(scenario, session: RecordingSession, **limits):
+    scheduler = OutboundScheduler(**{"global_rate": 100, "chat_rate": 100, "chat_burst": 1, **limits})
+    session.middleware(scheduler)
+
+    async def runner():
+        try:
+            return await scenario(Bot(token="42:TEST", session=session))
+        finally:
+            await scheduler.close()
+
+    return asyncio.run(runner())
+
+
+def test_new_bucket_is_full_for_an_earlier_now():
+    now = time.monotonic()
+    bucket = TokenBucket(rate=20 / 60, capacity=1)
+    assert bucket.delay(now) == 0
+
+
+def test_interactive_to_new_group_is_not_passed_over():
+    async def scenario():
+        # глобальное ведро на один запрос: кто получит слот первым, тот и прав
+        scheduler = OutboundScheduler(global_rate=1, group_rate=20 / 60)
+        order = []
+
+        async def send(chat_id, priority, label):
+            await scheduler.acquire(chat_id, priority)
+            order.append(label)
+
+        try:
+            await asyncio.gather(send(USER_CHAT, BULK, "bulk"), send(GROUP_CHAT, INTERACTIVE, "interactive"))
+        finally:
+            await scheduler.close()
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "bulk"]
+
+
+def test_retry_waits_for_retry_after():
+    session = RecordingSession(fail_chat=USER_CHAT, failures=1, retry_after=1)
+
+    async def scenario(bot):
+        return await bot.send_message(USER_CHAT, "retry me")
+
+    message = run(scenario, session)
+    assert message.text == "retry me"
+    assert len(session.attempts) == 2
+    assert session.attempts[1][0] - session.attempts[0][0] >= 1 - 0.05
+
+
+def test_retry_limit_reraises():
+    session = RecordingSession(fail_chat=USER_CHAT, failures=10, retry_after=0)
+
+    async def scenario(bot):
+        await bot.send_message(USER_CHAT, "never delivered")
+
+    with pytest.raises(TelegramRetryAfter):
+        run(scenario, session, max_retries=2)
+    assert len(session.attempts) == 3
+
+
+@pytest.mark.parametrize("chat_id, limits", [
+    (USER_CHAT, {"chat_rate": 10, "chat_burst": 1}),
+    (GROUP_CHAT, {"group_rate": 10}),
+], ids=["private", "group"])
+def test_interactive_overtakes_queued_bulk(chat_id, limits):
+    session = RecordingSession()
+
+    async def scenario(bot):
+        async def bulk():
+            with bulk_sending():
+                await asyncio.gather(*(bot.send_message(chat_id, f"bulk {i}") for i in range(4)))
+
+        task = asyncio.create_task(bulk())
+        await asyncio.sleep(0.01)  # первая рассылка ушла, остальные ждут в очереди
+        await bot.send_message(chat_id, "interactive")
+        await task
+
+    run(scenario, session, **limits)
+    texts = [text for _, _, text in session.attempts]
+    assert texts[0] == "bulk 0"
+    assert texts[1] == "interactive"
+    assert sorted(texts[2:]) == ["bulk 1", "bulk 2", "bulk 3"]
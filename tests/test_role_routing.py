@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from aiogram import Bot
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import bot as bot_module
+import handlers.filters
+import handlers.middlewares
+from benchmarks.run import FakeSession, message_update, callback_update
+from handlers.admin_panel import admin_router
+from handlers.parent_panel import parent_router
+from handlers.services import UserRole
+from handlers.student_panel import student_router
+from handlers.tutor_panel import tutor_router
+
+ADMIN_ID, TUTOR_ID, UNKNOWN_ID = 101, 202, 303
+ROLES = {
+    ADMIN_ID: UserRole(role="admin", telegram_id=ADMIN_ID, id=1, name="Admin", is_admin=True, roles=("admin",)),
+    TUTOR_ID: UserRole(role="tutor", telegram_id=TUTOR_ID, id=2, name="Tutor", roles=("tutor",)),
+}
+ROLE_ROUTERS = {"admin_panel": admin_router, "tutor_panel": tutor_router,
+                "student_panel": student_router, "parent_panel": parent_router}
+
+
+@pytest.fixture(scope="module")
+def module_dispatcher():
+    # роутеры — глобальные объекты модулей и подключаются к диспетчеру только один раз
+    return bot_module.create_dispatcher(storage=MemoryStorage())
+
+
+@pytest.fixture
+def dispatcher(module_dispatcher):
+    # /start у незнакомца ставит состояние регистрации — каждый тест начинает с чистого FSM
+    module_dispatcher.storage.storage.clear()
+    return module_dispatcher
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    calls = []
+
+    async def fake_resolve_role(telegram_id: int) -> UserRole:
+        calls.append(telegram_id)
+        return ROLES.get(telegram_id, UserRole(role="unknown", telegram_id=telegram_id))
+
+    monkeypatch.setattr(handlers.middlewares, "resolve_role", fake_resolve_role)
+    monkeypatch.setattr(handlers.filters, "resolve_role", fake_resolve_role)
+    return calls
+
+
+@pytest.fixture
+def visited(monkeypatch):
+    names = []
+    for name, router in ROLE_ROUTERS.items():
+        original = router.propagate_event
+
+        async def spy(*args, _name=name, _original=original, **kwargs):
+            names.append(_name)
+            return await _original(*args, **kwargs)
+
+        monkeypatch.setattr(router, "propagate_event", spy)
+    return names
+
+
+def feed(dp, update):
+    bot = Bot(token="42:TEST", session=FakeSession())
+    return asyncio.run(dp.feed_update(bot, update))
+
+
+@pytest.mark.parametrize("make_update", [
+    lambda user_id: message_update(user_id, "текст, который никто не обрабатывает"),
+    lambda user_id: callback_update(user_id, "nobody_handles_this"),
+    lambda user_id: message_update(user_id, "/start"),
+], ids=["message", "callback", "start"])
+@pytest.mark.parametrize("user_id", [ADMIN_ID, TUTOR_ID, UNKNOWN_ID])
+def test_one_role_lookup_per_update(dispatcher, lookups, make_update, user_id):
+    feed(dispatcher, make_update(user_id))
+    assert lookups == [user_id]
+
+
+@pytest.mark.parametrize("make_update", [
+    lambda user_id: message_update(user_id, "текст, который никто не обрабатывает"),
+    lambda user_id: callback_update(user_id, "nobody_handles_this"),
+], ids=["message", "callback"])
+@pytest.mark.parametrize("user_id, expected", [
+    (ADMIN_ID, ["admin_panel"]),
+    (TUTOR_ID, ["tutor_panel"]),
+    (UNKNOWN_ID, []),
+])
+def test_update_reaches_only_own_role_router(dispatcher, lookups, visited, make_update, user_id, expected):
+    feed(dispatcher, make_update(user_id))
+    assert visited == expected
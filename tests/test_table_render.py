@@ -0,0 +1,32 @@
+import asyncio
+import sys
+import types
+
+import pytest
+
+from database import table_render
+
+
+@pytest.fixture
+def fresh_pool():
+    yield
+    if table_render._executor is not None:
+        table_render._executor.shutdown()
+        table_render._executor = None
+
+
+def test_workers_do_not_reimport_main_script(tmp_path, monkeypatch, fresh_pool):
+    # главный скрипт, который оставляет след, если его импортирует воркер
+    marker = tmp_path / "imported"
+    script = tmp_path / "fake_bot.py"
+    script.write_text(f"open({str(marker)!r}, 'w').close()\n")
+    main = types.ModuleType("__main__")
+    main.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, "__main__", main)
+
+    rows = [["id", "name"], ["1", "Аня"], ["2", "Борис"]]
+    png = asyncio.run(table_render.render_table(rows, None))
+
+    assert png.startswith(b"\x89PNG")
+    assert not marker.exists()
+    assert sys.modules["__main__"] is main
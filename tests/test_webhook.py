@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks.run import FakeSession
+import webhook
+from webhook import create_app, run_webhook
+
+SECRET = "s3cret"
+
+
+def update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1000 + update_id, "is_bot": False, "first_name": "test"},
+            "text": "hi",
+        },
+    }
+
+
+class SlowDispatcher:
+    """Диспетчер с одним медленным хендлером, который запоминает пиковую параллельность."""
+
+    def __init__(self, delay: float = 0.05):
+        self.dp = Dispatcher()
+        self.active = 0
+        self.peak = 0
+        self.handled = 0
+        self.release = asyncio.Event()
+        self.delay = delay
+        self.dp.message.register(self.handle)
+
+    async def handle(self, message: Message):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            await self.release.wait()
+        finally:
+            self.active -= 1
+            self.handled += 1
+
+
+async def _wait_for(predicate, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_rejects_wrong_secret():
+    async def run():
+        slow = SlowDispatcher()
+        bot = Bot(token="42:TEST", session=FakeSession())
+        async with TestClient(TestServer(create_app(slow.dp, bot, secret_token=SECRET))) as client:
+            response = await client.post("/webhook", json=update(1),
+                                         headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+            assert response.status == 401
+        assert slow.handled == 0
+
+    asyncio.run(run())
+
+
+def test_answers_immediately_and_bounds_concurrency():
+    async def run():
+        slow = SlowDispatcher()
+        bot = Bot(token="42:TEST", session=FakeSession())
+        app = create_app(slow.dp, bot, secret_token=SECRET, max_in_flight=2, max_backlog=10)
+        async with TestClient(TestServer(app)) as client:
+            statuses = await asyncio.gather(*(
+                client.post("/webhook", json=update(i), headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+                for i in range(6)
+            ))
+            assert [r.status for r in statuses] == [200] * 6
+
+            slow.release.set()
+            await _wait_for(lambda: slow.handled == 6)
+        assert slow.peak == 2
+
+    asyncio.run(run())
+
+
+def test_overflowing_backlog_gets_503():
+    async def run():
+        slow = SlowDispatcher()
+        bot = Bot(token="42:TEST", session=FakeSession())
+        app = create_app(slow.dp, bot, secret_token=SECRET, max_in_flight=1, max_backlog=2)
+        headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        async with TestClient(TestServer(app)) as client:
+            statuses = [(await client.post("/webhook", json=update(i), headers=headers)).status for i in range(5)]
+            assert statuses == [200, 200, 200, 503, 503]
+
+            slow.release.set()
+            await _wait_for(lambda: slow.handled == 3)
+            # очередь разгрузилась — снова принимаем
+            assert (await client.post("/webhook", json=update(10), headers=headers)).status == 200
+
+    asyncio.run(run())
+
+
+def test_refuses_to_start_without_secret(monkeypatch):
+    monkeypatch.setattr(webhook, "WEBHOOK_BASE_URL", "https://bot.example.com")
+    monkeypatch.setattr(webhook, "WEBHOOK_SECRET", None)
+    with pytest.raises(RuntimeError, match="WEBHOOK_SECRET"):
+        asyncio.run(run_webhook(Dispatcher(), Bot(token="42:TEST", session=FakeSession())))
@@ -0,0 +1,80 @@
+import asyncio
+from typing import Any, Dict
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from conf import WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET, \
+    WEBHOOK_MAX_IN_FLIGHT, WEBHOOK_MAX_BACKLOG, logger
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """
+    Сразу отвечает Telegram 200 и обрабатывает апдейт в фоне,
+    но одновременно в диспетчере не больше max_in_flight апдейтов.
+    Ещё не больше max_backlog апдейтов ждут своей очереди; сверх этого отвечаем 503,
+    и Telegram повторит доставку позже, а не копит у нас задачи без предела.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_in_flight: int, max_backlog: int,
+                 secret_token: str | None = None, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.max_in_flight = max_in_flight
+        self.max_backlog = max_backlog
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        if len(self._background_feed_update_tasks) >= self.max_in_flight + self.max_backlog:
+            logger.warning(f"Очередь webhook переполнена ({len(self._background_feed_update_tasks)}), отвечаем 503")
+            return web.Response(status=503, text="Overloaded")
+        return await super()._handle_request_background(bot, request)
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            try:
+                await super()._background_feed_update(bot, update)
+            except Exception:
+                logger.exception(f"Ошибка при обработке апдейта {update.get('update_id')}")
+
+
+def create_app(dp: Dispatcher, bot: Bot, secret_token: str | None = WEBHOOK_SECRET,
+               max_in_flight: int = WEBHOOK_MAX_IN_FLIGHT, max_backlog: int = WEBHOOK_MAX_BACKLOG,
+               path: str = WEBHOOK_PATH) -> web.Application:
+    app = web.Application()
+    BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        max_in_flight=max_in_flight,
+        max_backlog=max_backlog,
+        secret_token=secret_token
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужно задать WEBHOOK_BASE_URL")
+    if not WEBHOOK_SECRET:
+        # без секрета любой, кто достучится до порта, может прислать апдейт от имени админа
+        raise RuntimeError("Для BOT_MODE=webhook нужно задать WEBHOOK_SECRET")
+
+    runner = web.AppRunner(create_app(dp, bot))
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    await site.start()
+
+    await bot.set_webhook(
+        url=f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        max_connections=max(1, min(WEBHOOK_MAX_IN_FLIGHT, 100)),
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True
+    )
+    logger.info(f"Webhook слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()